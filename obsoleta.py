@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
-import argparse, json, os, traceback
-from obsoleta.log import set_log_colors, set_log_level, inf, deb, err, print_result, print_result_nl
+import argparse, json, os, sys, traceback
+from obsoleta.log import set_log_colors, set_log_level, inf, deb, err, print_result, print_result_nl, handler
+from obsoleta.log import logger, default_level
 from obsoleta.common import Conf, pretty
 from obsoleta.errorcodes import ErrorCode
 from obsoleta.package import Package
-from obsoleta.obsoletacore import Obsoleta
+from obsoleta.cachefile import clear_cache_dir
 from obsoleta.obsoleta_api import ObsoletaApi
 from obsoleta.exceptions import ObsoletaException
+from obsoleta.server import ObsoletaServer, query_server
+from obsoleta.buildplan import load_timings
 
 # This is the script for calling obsoleta from the command line.
 
@@ -20,8 +23,16 @@ parser.add_argument('--root',
                          'Use this and/or roots in obsoleta.conf (default runs from current)')
 parser.add_argument('--depth',
                     help='search depth relative to root(s). Default 1')
+parser.add_argument('--jobs',
+                    help='number of threads used when scanning the root(s). Default 1')
+parser.add_argument('--gitindex', action='store_true',
+                    help='find package files from the git index for roots in git work trees')
+parser.add_argument('--lazy', action='store_true',
+                    help='resolve only the dependency tree of the package given, not the full workspace')
 parser.add_argument('--blacklist_paths', action='store',
                     help=': separated list of blacklist substrings')
+parser.add_argument('--blacklist_globs', action='store',
+                    help=': separated list of blacklist glob patterns matching the full path, e.g. "*/build_*"')
 parser.add_argument('--keepgoing', action='store_true',
                     help='attempt to ignore e.g. packages with otherwise fatal errors')
 parser.add_argument('--key',
@@ -35,6 +46,15 @@ parser.add_argument('--tree', action='store_true',
                     help='command: show tree for a package')
 parser.add_argument('--buildorder', action='store_true',
                     help='command: show dependencies in building order for a package')
+parser.add_argument('--buildwaves', action='store_true',
+                    help='command: as --buildorder but with a line for each wave of packages that can be '
+                         'built concurrently once the previous waves are built')
+parser.add_argument('--buildplan', type=int, metavar='WORKERS',
+                    help='command: schedule the build order on WORKERS workers with the critical path first, using '
+                         'the "build_cost" of the packages or the times in --timings')
+parser.add_argument('--timings', metavar='FILE',
+                    help='json file with the expected build time for packages by name or package string, e.g. '
+                         'from previous builds. Used with --buildplan')
 parser.add_argument('--listmissing', action='store_true',
                     help='command: list missing packages in --package dependency tree')
 parser.add_argument('--listmissingfull', action='store_true',
@@ -71,13 +91,26 @@ parser.add_argument('--keeptrack', action='store_true',
 parser.add_argument('--printpaths', action='store_true',
                     help='print package paths rather than the compressed form')
 
+parser.add_argument('--batch', metavar='FILE',
+                    help='command: run the json lines queries {"command", "package", "options"} in FILE, or stdin '
+                         'for "-", on the loaded packages and write a json line with the result of each query')
+
+parser.add_argument('--serve', metavar='SOCKET',
+                    help='keep the loaded packages in memory and answer queries from --connect on the unix socket '
+                         'SOCKET. Package files are reloaded when they change')
+parser.add_argument('--connect', metavar='SOCKET',
+                    help='run the command on a server started with --serve on the unix socket SOCKET. The search '
+                         'roots and configuration are the ones given to the server')
+
 parser.add_argument('--conf', dest='conffile',
                     help='load specified configuration file rather than the default obsoleta.conf. Use "default" '
                          'to use the built-in default configuration')
 parser.add_argument('--clearcache', action='store_true',
-                    help='delete the cache file')
+                    help='delete the cache files and the scan manifest of all roots and configurations')
+parser.add_argument('--cachedir',
+                    help='directory for the cache files and the scan manifest. Default ./obsoleta/local')
 parser.add_argument('--dumpcache', action='store_true',
-                    help='generate a cache file and dump on stdout (for analysis)')
+                    help='dump the resolved packages as json on stdout (for analysis)')
 parser.add_argument('--verbose', action='store_true',
                     help='enable all log messages (and stacktraces on unhandled exceptions)')
 parser.add_argument('--info', action='store_true',
@@ -86,222 +119,398 @@ parser.add_argument('--yappi', action='store_true',
                     help='run yappi profiler')
 
 
-args = parser.parse_args()
-
-if args.yappi:
-    import yappirun
-    yappirun.start_yappi()
+def is_package_command(args):
+    return (args.tree or args.check or args.buildorder or args.buildwaves or args.buildplan is not None or
+            args.listmissing or args.listmissingfull or args.print or args.upstream or args.downstream or
+            args.bumpdirect or args.bump or args.digraph)
 
-set_log_colors()
-if args.verbose:
-    set_log_level(verbose=True)
-elif args.info:
-    set_log_level(info=True)
 
-valid_package_command = (args.tree or args.check or args.buildorder or args.listmissing or args.listmissingfull or
-                         args.print or args.upstream or args.downstream or args.bumpdirect or args.bump or args.digraph)
+def is_non_package_command(args):
+    # commands that needs no package defined
+    return args.dumpcache or args.printarchs or args.batch
 
-# commands that needs no package defined
-valid_non_package_command = args.dumpcache or args.printarchs
 
-valid_command = valid_package_command or valid_non_package_command
-
-if args.clearcache:
-    # clearcache can be used as standalone command
+def execute(obsoleta, args, exit_code=ErrorCode.OK):
+    """
+    Run the command given in 'args' on the ObsoletaApi 'obsoleta' and return the exit code.
+    If 'exit_code' is already a failure it is just reported.
+    """
     try:
-        os.remove(Obsoleta.default_cache_filename())
-        inf(f'cache cleared ({Obsoleta.default_cache_filename()})')
-    except:
-        err('cache not found')
-    if not valid_command:
-        # clearcache was a standalone invocation, we're good
-        exit(0)
-
-# go-no-go checks
+        if exit_code == ErrorCode.OK and is_package_command(args):
+            if args.path:
+                try:
+                    package = Package.construct_from_package_path(
+                        obsoleta.conf, args.path, key=args.key, keypath=args.keypath)
+                except FileNotFoundError as e:
+                    err(str(e))
+                    return ErrorCode.PACKAGE_NOT_FOUND
+            else:
+                package = Package.construct_from_compact(obsoleta.conf, args.package)
 
-if not valid_command:
-    err('no action specified (--check, --tree, --buildorder, --listmissing, --listmissingfull, --upstream,'
-        ' --downstream --printarchs --bumpdirect --bump --dumpcache --print')
-    exit(ErrorCode.MISSING_INPUT.value)
+    except ObsoletaException as e:
+        err(f'Exception {e.ErrorCode.name}: {str(e)}')
+        exit_code = e.ErrorCode
+    except Exception as e:
+        err(f'caught unexpected exception: {str(e)}')
+        if args.verbose:
+            print(traceback.format_exc())
+        return ErrorCode.UNKNOWN_EXCEPTION
 
-if valid_package_command and not args.package and not args.path:
-    err('no package specified (use --package for compact form or --path for package dir)')
-    exit(ErrorCode.MISSING_INPUT.value)
+    newline = not args.nnl
 
-# parse configuration file
+    # and now figure out what to do
+    try:
+        if exit_code != ErrorCode.OK:
+            pass
 
-conf = Conf(args.conffile)
+        elif args.dumpcache:
+            exit_code = ErrorCode.OK
+            print_result_nl(json.dumps(obsoleta.serialize(), indent=4))
 
-if args.depth:
-    # a depth given on the commandline overrules any depth there might have been in the configuration file
-    conf.depth = int(args.depth)
+        elif args.check:
+            deb(f'checking package "{package}"')
+            error, errors = obsoleta.get_errors(package)
 
-if args.keeptrack:
-    conf.keep_track = int(args.keeptrack)
+            if error.get_errorcode() == ErrorCode.PACKAGE_NOT_FOUND:
+                err(error.get_message())
+                exit_code = error.get_errorcode()
+            elif error.has_error() or errors:
+                err('checking package "%s": failed, %i errors found' % (package, len(errors)))
+                for error in errors:
+                    err('   ' + error.to_string())
+                    exit_code = error.get_errorcode()
+            else:
+                inf('checking package "%s": success' % package)
+                exit_code = ErrorCode.OK
 
-if args.keepgoing:
-    conf.keepgoing = True
+        elif args.tree:
+            inf('package tree for "%s"' % package)
+            error, result = obsoleta.tree(package)
+            if error.is_ok():
+                print_result("\n".join(result), newline)
+            else:
+                err(error.print())
+                exit_code = error.get_errorcode()
 
-conf.dump()
-exit_code = ErrorCode.OK
+        elif args.buildorder:
+            exit_code = ErrorCode.OK
+            deb('packages listed in buildorder')
+            errors, resolved = obsoleta.buildorder(package)
 
-try:
-    # construct obsoleta, load and parse everything in one go
-    obsoleta = ObsoletaApi(conf, args)
+            if errors[0].has_error():
+                for error in errors:
+                    err(error.get_message())
+                exit_code = errors[0].get_errorcode()
+            else:
+                for _package in resolved:
+                    if args.printpaths:
+                        print_result(_package.get_path(), True)
+                    else:
+                        print_result(_package.to_string(), True)
+
+                    _errors = _package.get_errors()
+                    if _errors:
+                        for _error in _errors:
+                            exit_code = _error.get_errorcode()
+                            err(' - error: ' + _error.to_string())
+
+        elif args.buildwaves:
+            exit_code = ErrorCode.OK
+            deb('packages listed in build waves')
+            errors, waves = obsoleta.buildwaves(package)
 
-    if valid_package_command:
-        if args.path:
+            if errors[0].has_error():
+                for error in errors:
+                    err(error.get_message())
+                exit_code = errors[0].get_errorcode()
+            else:
+                for wave in waves:
+                    if args.printpaths:
+                        print_result(' '.join(_package.get_path() for _package in wave), True)
+                    else:
+                        print_result(' '.join(_package.to_string() for _package in wave), True)
+
+                    for _package in wave:
+                        for _error in _package.get_errors() or []:
+                            exit_code = _error.get_errorcode()
+                            err(' - error: ' + _error.to_string())
+
+        elif args.buildplan is not None:
+            exit_code = ErrorCode.OK
+            deb('packages scheduled in build plan')
+            errors, plan = [], None
             try:
-                package = Package.construct_from_package_path(
-                    conf, args.path, key=args.key, keypath=args.keypath)
-            except FileNotFoundError as e:
+                if args.buildplan < 1:
+                    raise ObsoletaException(f'--buildplan needs at least 1 worker, got {args.buildplan}',
+                                            ErrorCode.MISSING_INPUT)
+                timings = load_timings(args.timings) if args.timings else None
+                errors, plan = obsoleta.buildplan(package, args.buildplan, timings)
+            except ObsoletaException as e:
                 err(str(e))
-                exit(ErrorCode.PACKAGE_NOT_FOUND.value)
-        else:
-            package = Package.construct_from_compact(conf, args.package)
+                exit_code = e.ErrorCode
 
-except ObsoletaException as e:
-    err(f'Exception {e.ErrorCode.name}: {str(e)}')
-    exit_code = e.ErrorCode
-except Exception as e:
-    err(f'caught unexpected exception: {str(e)}')
-    if args.verbose:
-        print(traceback.format_exc())
-    exit(ErrorCode.UNKNOWN_EXCEPTION.value)
+            if plan:
+                def name(_package):
+                    return _package.get_path() if args.printpaths else _package.to_string()
 
-newline = not args.nnl
+                for step in plan.steps:
+                    print_result(f'{step.start:g} {step.end:g} {step.worker} {name(step.package)}', True)
+                print_result(f'critical path {plan.critical_path_time:g}: '
+                             f'{" ".join(name(_package) for _package in plan.critical_path)}', True)
+                print_result(f'total time {plan.total_time:g}', True)
 
-# and now figure out what to do
-try:
-    if exit_code != ErrorCode.OK:
-        pass
+                for step in plan.steps:
+                    for _error in step.package.get_errors() or []:
+                        exit_code = _error.get_errorcode()
+                        err(' - error: ' + _error.to_string())
+            elif errors:
+                for error in errors:
+                    err(error.get_message())
+                exit_code = errors[0].get_errorcode()
 
-    elif args.dumpcache:
-        exit_code = ErrorCode.OK
-        print_result_nl(json.dumps(obsoleta.serialize(), indent=4))
+        elif args.print:
+            error, jsn = obsoleta.print(package)
+            if error.is_ok():
+                print(pretty(jsn))
+            exit_code = error.get_errorcode()
 
-    elif args.check:
-        deb(f'checking package "{package}"')
-        error, errors = obsoleta.get_errors(package)
+        elif args.listmissing:
+            exit_code = ErrorCode.OK
+            deb('list any missing packages for %s' % package)
+            error, missing_list = obsoleta.list_missing(package)
+            for missing in missing_list:
+                print(missing.to_string())
 
-        if error.get_errorcode() == ErrorCode.PACKAGE_NOT_FOUND:
-            err(error.get_message())
-            exit_code = error.get_errorcode()
-        elif error.has_error() or errors:
-            err('checking package "%s": failed, %i errors found' % (package, len(errors)))
-            for error in errors:
-                err('   ' + error.to_string())
-                exit_code = error.get_errorcode()
-        else:
-            inf('checking package "%s": success' % package)
+        elif args.listmissingfull:
             exit_code = ErrorCode.OK
+            deb('extended list of any missing packages for %s' % package)
+            error, missing = obsoleta.list_missing_full(package)
+            print(pretty(missing))
 
-    elif args.tree:
-        inf('package tree for "%s"' % package)
-        error, result = obsoleta.tree(package)
-        if error.is_ok():
-            print_result("\n".join(result), newline)
-        else:
-            err(error.print())
-            exit_code = error.get_errorcode()
+        elif args.printarchs:
+            exit_code = ErrorCode.OK
+            error, archs = obsoleta.get_all_archs()
+            for arch in archs:
+                print(arch)
+
+        elif args.upstream:
+            error, lookup = obsoleta.upstreams(package)
+            if error.is_ok():
+                print_result("\n".join(p.get_path() for p in lookup), newline)
+                exit_code = ErrorCode.OK
+            elif error.get_errorcode() == ErrorCode.CIRCULAR_DEPENDENCY:
+                err(f'unable to locate upstream {package}, circular dependency {error.get_message()}')
+                exit_code = ErrorCode.CIRCULAR_DEPENDENCY
+            else:
+                err('unable to locate upstream %s' % package)
+                exit_code = ErrorCode.PACKAGE_NOT_FOUND
 
-    elif args.buildorder:
-        exit_code = ErrorCode.OK
-        deb('packages listed in buildorder')
-        errors, resolved = obsoleta.buildorder(package)
+        elif args.downstream:
+            error, lookup = obsoleta.downstreams(package)
+            if error.is_ok():
+                print_result("\n".join(p.get_path() for p in lookup), newline)
+                exit_code = ErrorCode.OK
+            else:
+                err('unable to locate downstream %s' % package)
+                exit_code = ErrorCode.PACKAGE_NOT_FOUND
 
-        if errors[0].has_error():
-            for error in errors:
-                err(error.get_message())
-            exit_code = errors[0].get_errorcode()
-        else:
-            for _package in resolved:
-                if args.printpaths:
-                    print_result(_package.get_path(), True)
+        elif args.dumpcache:
+            pass
+
+        elif args.bumpdirect or args.bump:
+            if not args.version:
+                exit_code = ErrorCode.MISSING_INPUT
+            else:
+                error, messages = obsoleta.bump(package, args.version, args.bump, args.dryrun, indent_messages=True)
+                if error.is_ok():
+                    print_result_nl("\n".join(line for line in messages))
+                    exit_code = ErrorCode.OK
                 else:
-                    print_result(_package.to_string(), True)
+                    err(error.get_message())
+                    exit_code = error.get_errorcode()
 
-                _errors = _package.get_errors()
-                if _errors:
-                    for _error in _errors:
-                        exit_code = _error.get_errorcode()
-                        err(' - error: ' + _error.to_string())
+        elif args.digraph:
+            obsoleta.generate_digraph(package)
 
-    elif args.print:
-        error, jsn = obsoleta.print(package)
-        if error.is_ok():
-            print(pretty(jsn))
-        exit_code = error.get_errorcode()
-
-    elif args.listmissing:
-        exit_code = ErrorCode.OK
-        deb('list any missing packages for %s' % package)
-        error, missing_list = obsoleta.list_missing(package)
-        for missing in missing_list:
-            print(missing.to_string())
-
-    elif args.listmissingfull:
-        exit_code = ErrorCode.OK
-        deb('extended list of any missing packages for %s' % package)
-        error, missing = obsoleta.list_missing_full(package)
-        print(pretty(missing))
-
-    elif args.printarchs:
-        exit_code = ErrorCode.OK
-        error, archs = obsoleta.get_all_archs()
-        for arch in archs:
-            print(arch)
-
-    elif args.upstream:
-        error, lookup = obsoleta.upstreams(package)
-        if error.is_ok():
-            print_result("\n".join(p.get_path() for p in lookup), newline)
-            exit_code = ErrorCode.OK
         else:
-            err('unable to locate upstream %s' % package)
-            exit_code = ErrorCode.PACKAGE_NOT_FOUND
+            err("no valid command found")
 
-    elif args.downstream:
-        error, lookup = obsoleta.downstreams(package)
-        if error.is_ok():
-            print_result("\n".join(p.get_path() for p in lookup), newline)
-            exit_code = ErrorCode.OK
-        else:
-            err('unable to locate downstream %s' % package)
-            exit_code = ErrorCode.PACKAGE_NOT_FOUND
+        if exit_code != ErrorCode.OK:
+            print()
+            err('failed with error %i: %s' % (exit_code.value, ErrorCode.to_string(exit_code.value)))
 
-    elif args.dumpcache:
-        pass
+        return exit_code
 
-    elif args.bumpdirect or args.bump:
-        if not args.version:
-            exit_code = ErrorCode.MISSING_INPUT
-        else:
-            error, messages = obsoleta.bump(package, args.version, args.bump, args.dryrun, indent_messages=True)
-            if error.is_ok():
-                print_result_nl("\n".join(line for line in messages))
-                exit_code = ErrorCode.OK
-            else:
-                err(error.get_message())
-                exit_code = error.get_errorcode()
+    except Exception as e:
+        err(f'command gave unexpected exception: {str(e)}')
+        if args.verbose or args.info:
+            print(traceback.format_exc())
+        return ErrorCode.UNKNOWN_EXCEPTION
 
-    elif args.digraph:
-        obsoleta.generate_digraph(package)
 
+def execute_batch(obsoleta, file):
+    """
+    Run the json lines queries from 'file' on the ObsoletaApi 'obsoleta' and print a json line with
+    the result of each query as soon as it is done, see ObsoletaApi.run_query(). The log goes to stderr
+    to keep stdout for the results. Returns the exit code of the last failing query or ErrorCode.OK.
+    """
+    exit_code = ErrorCode.OK
+    stream = handler.setStream(sys.stderr)
+    try:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                result = obsoleta.run_query(json.loads(line))
+            except (ValueError, AttributeError) as e:
+                result = {'command': None, 'package': None, 'errorcode': ErrorCode.SYNTAX_ERROR.value,
+                          'errors': [f'invalid query: {str(e)}'], 'result': None}
+            if result['errorcode'] != ErrorCode.OK.value:
+                exit_code = ErrorCode(result['errorcode'])
+            print(json.dumps(result), flush=True)
+    finally:
+        handler.setStream(stream)
+    return exit_code
+
+
+def execute_query(obsoleta, argv, exception):
+    """
+    Run the command line 'argv' from a --connect client on the ObsoletaApi kept by --serve. The
+    log level is the one the command would have run with directly, the server restores its own.
+    """
+    args = parser.parse_args(argv)
+    if args.verbose or args.info:
+        set_log_level(verbose=args.verbose, info=args.info)
     else:
-        err("no valid command found")
+        logger.setLevel(default_level)
+    exit_code = ErrorCode.OK
+    if exception:
+        err(f'Exception {exception.ErrorCode.name}: {str(exception)}')
+        exit_code = exception.ErrorCode
+    return execute(obsoleta, args, exit_code)
+
 
-    if exit_code != ErrorCode.OK:
-        print()
-        err('failed with error %i: %s' % (exit_code.value, ErrorCode.to_string(exit_code.value)))
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.yappi:
+        import yappirun
+        yappirun.start_yappi()
+
+    set_log_colors()
+    if args.verbose:
+        set_log_level(verbose=True)
+    elif args.info:
+        set_log_level(info=True)
+
+    valid_package_command = is_package_command(args)
+
+    valid_non_package_command = is_non_package_command(args)
+
+    valid_command = valid_package_command or valid_non_package_command
+
+    # go-no-go checks
+
+    if not valid_command and not args.serve and not args.clearcache:
+        err('no action specified (--check, --tree, --buildorder, --listmissing, --listmissingfull, --upstream,'
+            ' --downstream --printarchs --bumpdirect --bump --dumpcache --print --batch')
+        exit(ErrorCode.MISSING_INPUT.value)
+
+    if valid_package_command and not args.package and not args.path:
+        err('no package specified (use --package for compact form or --path for package dir)')
+        exit(ErrorCode.MISSING_INPUT.value)
+
+    if args.connect:
+        if args.batch:
+            err('--batch can\'t be used with --connect, '
+                'run the batch queries on a single loaded model with --batch alone')
+            exit(ErrorCode.MISSING_INPUT.value)
+        try:
+            output, exit_code = query_server(args.connect, sys.argv[1:])
+        except ObsoletaException as e:
+            err(f'Exception {e.ErrorCode.name}: {str(e)}')
+            exit(e.ErrorCode.value)
+        print_result(output)
+        exit(exit_code)
+
+    # parse configuration file
+
+    conf = Conf(args.conffile)
+
+    if args.depth:
+        # a depth given on the commandline overrules any depth there might have been in the configuration file
+        conf.depth = int(args.depth)
+
+    if args.jobs:
+        conf.jobs = int(args.jobs)
+
+    if args.gitindex:
+        conf.git_index = True
+
+    if args.lazy:
+        conf.lazy = True
+
+    if args.keeptrack:
+        conf.keep_track = int(args.keeptrack)
+
+    if args.keepgoing:
+        conf.keepgoing = True
+
+    if args.cachedir:
+        conf.cache_dir = os.path.abspath(args.cachedir)
+
+    if args.clearcache:
+        # clearcache can be used as standalone command
+        cleared = clear_cache_dir(conf.cache_dir)
+        if cleared:
+            inf(f'cache cleared ({len(cleared)} configurations in {conf.cache_dir})')
+        else:
+            err('cache not found')
+        if not valid_command:
+            # clearcache was a standalone invocation, we're good
+            exit(0)
+
+    conf.dump()
+
+    if args.serve:
+        try:
+            server = ObsoletaServer(args.serve, lambda: ObsoletaApi(conf, args), execute_query)
+        except ObsoletaException as e:
+            err(f'Exception {e.ErrorCode.name}: {str(e)}')
+            exit(e.ErrorCode.value)
+        server.serve()
+        exit(ErrorCode.OK.value)
+
+    exit_code = ErrorCode.OK
+    obsoleta = None
+
+    try:
+        # construct obsoleta, load and parse everything in one go
+        obsoleta = ObsoletaApi(conf, args)
+
+    except ObsoletaException as e:
+        err(f'Exception {e.ErrorCode.name}: {str(e)}')
+        exit_code = e.ErrorCode
+    except Exception as e:
+        err(f'caught unexpected exception: {str(e)}')
+        if args.verbose:
+            print(traceback.format_exc())
+        exit(ErrorCode.UNKNOWN_EXCEPTION.value)
+
+    if args.batch and exit_code == ErrorCode.OK:
+        try:
+            if args.batch == '-':
+                exit_code = execute_batch(obsoleta, sys.stdin)
+            else:
+                with open(args.batch) as f:
+                    exit_code = execute_batch(obsoleta, f)
+        except OSError as e:
+            err(f'unable to read batch file: {str(e)}')
+            exit_code = ErrorCode.BAD_PATH
+    else:
+        exit_code = execute(obsoleta, args, exit_code)
 
     if args.yappi:
         yappirun.stop_yappi()
 
     exit(exit_code.value)
-
-except Exception as e:
-    err(f'command gave unexpected exception: {str(e)}')
-    if args.verbose or args.info:
-        print(traceback.format_exc())
-    exit(ErrorCode.UNKNOWN_EXCEPTION.value)
@@ -0,0 +1,139 @@
+import json, math, heapq
+from .log import war
+from .exceptions import BadPath
+
+default_build_cost = 1.0
+
+
+def valid_build_time(value):
+    """
+    Return True if 'value' from a json file is a usable build time, a finite number that is zero or more.
+    """
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and math.isfinite(value) and value >= 0
+
+
+def load_timings(path):
+    """
+    Read a timings file with the build times from previous runs. It is a json object with either
+    the package names or the full package strings as keys and the build times, zero or positive
+    numbers, as values.
+    """
+    try:
+        with open(path) as f:
+            timings = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise BadPath(f'unable to read timings file {path}: {str(e)}')
+    if not isinstance(timings, dict):
+        raise BadPath(f'timings file {path} is not a json object')
+    for key, value in timings.items():
+        if not valid_build_time(value):
+            raise BadPath(f'timings file {path} has an invalid build time for "{key}": {json.dumps(value)}')
+    return timings
+
+
+def build_cost(package, timings=None):
+    """
+    The expected time to build 'package'. A timing for the full package string is preferred over
+    one for its name, then comes the optional "build_cost" in the package file and finally the
+    default cost.
+    """
+    if timings:
+        for key in (package.to_string(), package.get_name()):
+            if key in timings:
+                return float(timings[key])
+    cost = package.get_value('build_cost')
+    if cost is not None:
+        if valid_build_time(cost):
+            return float(cost)
+        war(f'ignoring the invalid "build_cost" {json.dumps(cost)} of {package.to_string()}, '
+            f'using {default_build_cost:g}')
+    return default_build_cost
+
+
+class BuildStep:
+    def __init__(self, package, worker, start, end):
+        self.package = package
+        self.worker = worker
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f'{self.start:g}-{self.end:g} worker {self.worker} {self.package.to_string()}'
+
+
+class BuildPlan:
+    """
+    A schedule for building the packages in a build order on a number of workers. 'steps' are
+    the BuildStep for each package in the order they are started, 'total_time' is the expected
+    time until the last package is built and 'critical_path' the longest chain of packages
+    that depend on each other, which takes 'critical_path_time' to build regardless of the number
+    of workers.
+    """
+    def __init__(self, steps, total_time, critical_path, critical_path_time):
+        self.steps = steps
+        self.total_time = total_time
+        self.critical_path = critical_path
+        self.critical_path_time = critical_path_time
+
+
+def make_build_plan(packages, workers, costs):
+    """
+    List scheduling of 'packages', given in build order, on 'workers' workers with the expected build
+    time of each package in 'costs'. Whenever a worker is idle it starts the ready package with the
+    longest remaining path to the end of the build (its bottom level), which puts the critical path
+    first. Ties go to the package first in the build order.
+    """
+    workers = max(1, workers)
+    index = {package.to_string(): i for i, package in enumerate(packages)}
+    upstreams = [0] * len(packages)
+    downstreams = [[] for _ in packages]
+    for i, package in enumerate(packages):
+        for dependency in package.get_dependencies() or []:
+            upstream = index.get(dependency.to_string())
+            if upstream is not None and upstream != i:
+                upstreams[i] += 1
+                downstreams[upstream].append(i)
+
+    sources = [i for i, count in enumerate(upstreams) if not count]
+
+    # the build order is topological so the downstreams are always done before their upstreams here
+    bottom_levels = [0.0] * len(packages)
+    for i in reversed(range(len(packages))):
+        bottom_levels[i] = costs[i] + max((bottom_levels[downstream] for downstream in downstreams[i]), default=0.0)
+
+    ready = [(-bottom_levels[i], i) for i in sources]
+    heapq.heapify(ready)
+    idle = list(range(1, workers + 1))
+    running = []
+    steps = []
+    now = 0.0
+
+    while ready or running:
+        while ready and idle:
+            _, i = heapq.heappop(ready)
+            worker = heapq.heappop(idle)
+            steps.append(BuildStep(packages[i], worker, now, now + costs[i]))
+            heapq.heappush(running, (now + costs[i], worker, i))
+
+        now, worker, i = heapq.heappop(running)
+        heapq.heappush(idle, worker)
+        for downstream in downstreams[i]:
+            upstreams[downstream] -= 1
+            if not upstreams[downstream]:
+                heapq.heappush(ready, (-bottom_levels[downstream], downstream))
+
+    total_time = max((step.end for step in steps), default=0.0)
+
+    critical_path = []
+    if sources:
+        i = max(sources, key=lambda source: (bottom_levels[source], -source))
+        critical_path_time = bottom_levels[i]
+        while True:
+            critical_path.append(packages[i])
+            if not downstreams[i]:
+                break
+            i = max(downstreams[i], key=lambda downstream: (bottom_levels[downstream], -downstream))
+    else:
+        critical_path_time = 0.0
+
+    return BuildPlan(steps, total_time, critical_path, critical_path_time)
@@ -0,0 +1,163 @@
+import os, json, time, shutil, hashlib, tempfile, contextlib
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks, e.g. on windows. The files are still replaced in one rename.
+    fcntl = None
+from .log import deb, war
+
+# The cache files, see PackageCache, GraphCache and Manifest, are shared by all obsoleta runs with the
+# same roots and configuration, also when they run in parallel. A cache file is never written in place,
+# it is written to a temporary file next to it which is then renamed over it, so a reader always gets
+# either the previous or the next file in full. Writers hold an exclusive lock on the directory of the
+# cache file and readers a shared lock, so no lock files are left behind.
+
+# the prefix of the per configuration directories in the cache directory, see cache_namespace()
+namespace_prefix = 'obsoleta-'
+
+# cache files get the mode any other new file would get, not the private mode of mkstemp()
+umask = os.umask(0)
+os.umask(umask)
+file_mode = 0o666 & ~umask
+
+_source_digest = None
+
+
+def source_digest():
+    """
+    Return a hash of the obsoleta sources. It is part of every cache namespace so cache files written
+    by another obsoleta, which might read or resolve packages differently, are never used.
+    """
+    global _source_digest
+    if _source_digest is None:
+        digest = hashlib.sha1()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.py'):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    digest.update(name.encode() + b'\0' + f.read())
+        _source_digest = digest.hexdigest()
+    return _source_digest
+
+
+def cache_namespace(cache_dir, key):
+    """
+    Return the directory in 'cache_dir' for the cache files of the configuration described by the
+    string 'key' and of this obsoleta, see source_digest().
+    """
+    digest = hashlib.sha1((source_digest() + key).encode()).hexdigest()
+    return os.path.join(cache_dir, namespace_prefix + digest[:16])
+
+
+def clear_cache_dir(cache_dir):
+    """
+    Delete the cache files of all configurations in 'cache_dir' and return the directories deleted.
+    """
+    try:
+        entries = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return []
+    cleared = []
+    for entry in sorted(entries):
+        path = os.path.join(cache_dir, entry)
+        if entry.startswith(namespace_prefix) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            cleared.append(path)
+    return cleared
+
+
+@contextlib.contextmanager
+def locked(filename, exclusive=False):
+    """
+    Hold a shared, or an 'exclusive', lock for 'filename' while in the context. The lock is taken on
+    the directory of the file, so it covers all the cache files in it. Nothing is locked if the
+    directory can't be opened, e.g. when it doesn't exist yet.
+    """
+    fd = None
+    if fcntl:
+        try:
+            fd = os.open(os.path.dirname(filename) or '.', os.O_RDONLY)
+        except OSError:
+            pass
+    try:
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+@contextlib.contextmanager
+def open_locked(filename, mode='r'):
+    """
+    Open the cache file 'filename' for reading while holding a shared lock for it.
+    """
+    with locked(filename):
+        with open(filename, mode) as f:
+            yield f
+
+
+@contextlib.contextmanager
+def replace_atomically(filename, mode='w'):
+    """
+    Return a file opened with 'mode' that replaces 'filename' when the context is left, or is
+    deleted if an exception is raised. An exclusive lock for 'filename' is held meanwhile.
+    """
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    with locked(filename, exclusive=True):
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=os.path.basename(filename) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, mode) as f:
+                yield f
+            os.chmod(temporary, file_mode)
+            os.replace(temporary, filename)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+
+class JsonCacheFile:
+    """
+    The base of the json cache files holding entries recorded with the mtime of what they were made
+    from, see PackageCache and Manifest. The entries read by the subclass in the current run are
+    collected in 'visited' and only they are written back by save(). The 'entries' names both the
+    json member holding the entries and the entries in the log.
+    """
+    version = 1
+    entries = 'entries'
+    # a file or directory modified this close to the read can be modified again within the same
+    # mtime tick without the mtime changing. Such entries are not recorded, see recordable().
+    racy_seconds = 2
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.visited = {}
+        self.read_time = time.time_ns()
+
+    def load(self):
+        """
+        Return the recorded entries, or an empty dictionary if there is no cache file of this version.
+        """
+        try:
+            with open_locked(self.filename) as f:
+                cache = json.loads(f.read())
+            recorded = cache[self.entries] if cache.get('version') == self.version else {}
+            deb(f'loaded {len(recorded)} {self.entries} from {self.filename}')
+            return recorded
+        except FileNotFoundError:
+            deb(f'no cache found at {self.filename}')
+        except (json.JSONDecodeError, KeyError, AttributeError):
+            war(f'ignoring invalid cache {self.filename}')
+        return {}
+
+    def recordable(self, mtime_ns):
+        """
+        Return True if what was modified at 'mtime_ns' is old enough to be recorded.
+        """
+        return self.read_time - mtime_ns > self.racy_seconds * 1000000000
+
+    def save(self):
+        with replace_atomically(self.filename) as f:
+            f.write(json.dumps({'version': self.version, self.entries: self.visited}))
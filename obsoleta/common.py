@@ -3,6 +3,7 @@ from enum import Enum
 from .log import set_log_level, deb
 from .errorcodes import ErrorCode
 from .exceptions import BadPath
+from .pathfilter import PathFilter
 
 
 class Position(Enum):
@@ -19,6 +20,7 @@ class Conf:
     def __init__(self, configuration_file=None):
         self.paths = []
         self.blacklist_paths = []
+        self.blacklist_globs = []
         self.using_track = False
         self.using_arch = False
         self.using_buildtype = False
@@ -26,7 +28,14 @@ class Conf:
         self.allow_duplicates = False
         self.keepgoing = False
         self.cache = False
+        self.scan_manifest = False
+        # find package files from the git index for roots in git work trees
+        self.git_index = False
         self.depth = 1
+        # number of threads used for scanning the roots for package files
+        self.jobs = 1
+        # resolve only the part of the dependency graph a query needs, when it is queried
+        self.lazy = False
         self.semver = False
         # allow a multislot key dir to be given as package root. Naughty,
         self.relaxed_multislot = False
@@ -35,6 +44,8 @@ class Conf:
         # The alternative is that only the slots for which a physical keyfile is found is parsed.
         self.parse_multislot_directly = True
         self.obsoleta_root = os.path.dirname(os.path.abspath(__file__))
+        # the directory holding the cache files and the scan manifest, see Obsoleta.cache_filename()
+        self.cache_dir = os.path.join(self.obsoleta_root, 'local')
 
         if configuration_file == 'default':
             return
@@ -62,6 +73,9 @@ class Conf:
                 blacklist_paths = conf.get('blacklist_paths')
                 if blacklist_paths:
                     self.blacklist_paths = blacklist_paths
+                blacklist_globs = conf.get('blacklist_globs')
+                if blacklist_globs:
+                    self.blacklist_globs = blacklist_globs
                 self.using_arch = conf.get('using_arch')
                 self.using_track = conf.get('using_track')
                 self.using_buildtype = conf.get('using_buildtype')
@@ -70,6 +84,11 @@ class Conf:
                 self.allow_duplicates = conf.get('allow_duplicates')
                 self.keepgoing = conf.get('keepgoing')
                 self.cache = conf.get('cache')
+                self.scan_manifest = conf.get('scan_manifest')
+                if conf.get('cache_dir'):
+                    self.cache_dir = os.path.abspath(os.path.expanduser(os.path.expandvars(conf['cache_dir'])))
+                self.git_index = conf.get('git_index')
+                self.lazy = conf.get('lazy')
                 self.semver = conf.get('semver')
                 self.relaxed_multislot = conf.get('relaxed_multislot')
                 self.keep_track = conf.get('keep_track')
@@ -80,12 +99,18 @@ class Conf:
                     self.depth = int(conf['depth'])
                 except KeyError:
                     pass
+                try:
+                    self.jobs = int(conf['jobs'])
+                except KeyError:
+                    pass
         except FileNotFoundError:
             raise Exception(f'configuration file "{conf_file}" not found')
 
     def dump(self):
         deb('Configuration:')
         deb(f'  depth = {self.depth}')
+        deb(f'  jobs = {self.jobs}')
+        deb(f'  cache_dir = {self.cache_dir}')
 
 
 class Args:
@@ -134,6 +159,20 @@ class Error:
             self.message = 'from parent ' + package.parent.to_string()
         else:
             self.message = ''
+        # errors are equal if their errorcode and package string are equal, as the printed error.
+        # The key is made once here so hashing and sorting errors doesn't format strings.
+        self.key = (errorcode.value, package.to_string() if package else '')
+
+    @classmethod
+    def construct_from_cache(cls, errorcode, package, message, key):
+        """
+        Returns an error restored from a graph cache with the recorded 'message' and package string
+        'key', which are kept as they were even if 'package' has changed since.
+        """
+        error = cls(errorcode, None, message)
+        error.package = package
+        error.key = (errorcode.value, key)
+        return error
 
     def get_errorcode(self):
         return self.errorcode
@@ -176,18 +215,16 @@ class Error:
         return str(self)
 
     def __eq__(self, other):
-        return self.__hash__() == other.__hash__()
+        return isinstance(other, Error) and self.key == other.key
 
     def __lt__(self, other):
-        if self.errorcode.value < other.errorcode.value:
-            return True
-        if self.message < other.message:
-            return True
-        return self.package.to_string() < other.package.to_string()
+        """
+        Order by errorcode, then message and then package.
+        """
+        return (self.key[0], self.message, self.key[1]) < (other.key[0], other.message, other.key[1])
 
     def __hash__(self):
-        uid = str(self)
-        return hash(uid)
+        return hash(self.key)
 
 
 class ErrorOk(Error):
@@ -195,10 +232,20 @@ class ErrorOk(Error):
         super(ErrorOk, self).__init__(ErrorCode.OK, None)
 
 
-def find_in_path(path, filename, conf, results, dirs_checked=1, _depth=None):
+def find_in_path(path, filename, conf, results, dirs_checked=1, _depth=None, path_filter=None, found=None,
+                 merged_roots=None):
+    """
+    Append the paths of all 'filename' files below 'path' to 'results'. If given then 'found'
+    is called with each path as soon as it is located.
+    Directories in 'merged_roots' are searched with the full conf.depth, see
+    Obsoleta.construct_root_list().
+    """
     if _depth is None:
         _depth = conf.depth
 
+    if path_filter is None:
+        path_filter = PathFilter.from_conf(conf)
+
     try:
         scan_list = list(os.scandir(path))
     except FileNotFoundError:
@@ -211,24 +258,24 @@ def find_in_path(path, filename, conf, results, dirs_checked=1, _depth=None):
 
     for entry in scan_list:
         if entry.is_dir():
-            is_blacklisted = False
-            for blacklist in conf.blacklist_paths:
-                if blacklist in os.path.join(path, entry.name):
-                    deb('- blacklisted, ignoring %s recursively' % entry.path)
-                    is_blacklisted = True
-
-            if is_blacklisted:
+            rule = path_filter.prune(entry.path)
+            if rule is not None:
+                deb('- blacklisted by "%s", ignoring %s recursively' % (rule, entry.path))
                 continue
 
             if _depth:
-                _depth -= 1
                 dirs_checked += 1
-                find_in_path(entry.path, filename, conf, results, dirs_checked, _depth)
-                _depth += 1
+                depth = _depth - 1
+                if merged_roots and entry.path in merged_roots:
+                    depth = conf.depth
+                find_in_path(entry.path, filename, conf, results, dirs_checked, depth, path_filter, found,
+                             merged_roots)
 
         if entry.name == filename:
             results.append(entry.path)
             deb('located %s' % printing_path(entry.path, conf))
+            if found:
+                found(entry.path)
 
     return dirs_checked
 
@@ -26,6 +26,8 @@ class ErrorCode(Enum):
     RESOLVE_ERROR = 21
     ILLEGAL_DEPENDENCY = 22
     MODIFYING_READONLY_PACKAGE = 23
+    MODEL_FROZEN = 24
+    SERVER_ERROR = 25
 
     @staticmethod
     def to_string(errorcode):
@@ -53,7 +55,9 @@ class ErrorCode(Enum):
              'Package not unique',
              'Resolve error',
              'Illegal dependency',
-             'Package is readonly'
+             'Package is readonly',
+             'Model is frozen',
+             'Server error'
              ]
 
         return ErrorCodeToString[errorcode]
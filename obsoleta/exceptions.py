@@ -53,6 +53,11 @@ class ModifyingReadonlyPackage(ObsoletaException):
         super().__init__(msg, ErrorCode.MODIFYING_READONLY_PACKAGE)
 
 
+class ModelFrozen(ObsoletaException):
+    def __init__(self, msg):
+        super().__init__(msg, ErrorCode.MODEL_FROZEN)
+
+
 class InvalidVersionNumber(ObsoletaException):
     def __init__(self, msg):
         super().__init__(msg, ErrorCode.INVALID_VERSION_NUMBER)
@@ -61,3 +66,8 @@ class InvalidVersionNumber(ObsoletaException):
 class UnknownException(ObsoletaException):
     def __init__(self, msg):
         super().__init__(msg, ErrorCode.UNKNOWN_EXCEPTION)
+
+
+class ServerError(ObsoletaException):
+    def __init__(self, msg):
+        super().__init__(msg, ErrorCode.SERVER_ERROR)
@@ -0,0 +1,133 @@
+import os, subprocess
+from .log import deb
+from .common import find_in_path, printing_path
+from .pathfilter import PathFilter
+
+skip_file = 'obsoleta.skip'
+
+
+def git_ls_files(path, options, filenames=None):
+    """
+    Return the files below 'path' listed by 'git ls-files' with the given options, with paths
+    relative to 'path'. Only files named as one of 'filenames' are listed if given.
+    Returns None if 'path' is not in a git work tree or if git isn't available.
+    """
+    pathspecs = []
+    for filename in filenames or ():
+        pathspecs += [filename, f'*/{filename}']
+    try:
+        result = subprocess.run(['git', '-C', path, 'ls-files', '-z'] + options + ['--'] + pathspecs,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if result.returncode:
+        return None
+    return [file for file in result.stdout.decode().split('\0') if file]
+
+
+def git_files(path, filename):
+    """
+    Return the tuple ([files], [directories]) below 'path', relative to 'path', or None if 'path'
+    is not in a git work tree.
+    The files are the 'filename' and skip files which are tracked (including in submodules),
+    untracked or ignored. The directories are the ones git doesn't list the files in, i.e.
+    untracked and ignored directories and nested git repositories that are not submodules.
+    They have to be scanned on the filesystem. The directory is '' if 'path' itself is untracked
+    or ignored.
+    """
+    names = (filename, skip_file)
+    tracked = git_ls_files(path, ['--cached', '--recurse-submodules'], names)
+    if tracked is None:
+        return None
+    # without pathspecs since git won't list a nested repository for a pathspec below it
+    untracked = git_ls_files(path, ['--others', '--exclude-standard', '--directory', '--no-empty-directory'])
+    ignored = git_ls_files(path, ['--others', '--ignored', '--exclude-standard', '--directory'], names)
+    files = set(tracked)
+    directories = set()
+    for entry in (untracked or []) + (ignored or []):
+        if entry == './':
+            # 'path' itself is untracked or ignored
+            directories.add('')
+        elif entry.endswith('/'):
+            directories.add(entry.rstrip('/'))
+        elif os.path.basename(entry) in names:
+            files.add(entry)
+    return sorted(files), sorted(directories)
+
+
+def find_in_git_index(path, filename, conf, results, path_filter=None, found=None, merged_roots=None):
+    """
+    As find_in_path() but the files are taken from git rather than by listing every directory
+    below 'path'. The depth, obsoleta.skip and blacklist rules are applied to the directories of
+    the listed files exactly as the filesystem walk would have applied them. The directories git
+    doesn't list the files in, see git_files(), are scanned with find_in_path() so the result is
+    the same as from the filesystem walk.
+    Falls back to find_in_path() if 'path' is not in a git work tree or if git lists nothing for it.
+    Returns the number of directories checked.
+    """
+    listed = git_files(path, filename)
+    if not listed or not any(listed) or '' in listed[1]:
+        deb(f'no git index files found for {path}, scanning the filesystem')
+        return find_in_path(path, filename, conf, results, path_filter=path_filter, found=found,
+                            merged_roots=merged_roots)
+    files, directories = listed
+
+    if path_filter is None:
+        path_filter = PathFilter.from_conf(conf)
+
+    # files still in the index but deleted in the work tree are ignored
+    files = [file for file in files if os.path.isfile(os.path.join(path, file))]
+    skipped = set(os.path.dirname(file) for file in files if os.path.basename(file) == skip_file)
+
+    # relative directory -> the remaining search depth when it is listed, None if it isn't
+    depths = {}
+
+    def remaining_depth(directory):
+        if directory in depths:
+            return depths[directory]
+        full_path = os.path.join(path, directory) if directory else path
+        if not directory:
+            depth = conf.depth
+        else:
+            depth = remaining_depth(os.path.dirname(directory))
+            if depth:
+                rule = path_filter.prune(full_path)
+                if rule is not None:
+                    deb('- blacklisted by "%s", ignoring %s recursively' % (rule, full_path))
+                    depth = None
+                elif merged_roots and full_path in merged_roots:
+                    depth = conf.depth
+                else:
+                    depth -= 1
+            else:
+                depth = None
+        if depth is not None and directory in skipped:
+            deb('- skip file found, ignoring %s recursively' % full_path)
+            depth = None
+        depths[directory] = depth
+        return depth
+
+    # a directory below another directory that is scanned anyway is left to that scan
+    directories = [directory for directory in directories
+                   if not any(directory.startswith(other + '/') for other in directories)]
+    scanned = tuple(directory + '/' for directory in directories)
+
+    for file in files:
+        if (os.path.basename(file) == filename and not file.startswith(scanned) and
+                remaining_depth(os.path.dirname(file)) is not None):
+            file_path = os.path.join(path, file)
+            results.append(file_path)
+            deb('located %s' % printing_path(file_path, conf))
+            if found:
+                found(file_path)
+
+    dirs_checked = 0
+    for directory in directories:
+        depth = remaining_depth(directory)
+        if depth is not None:
+            full_path = os.path.join(path, directory)
+            deb(f'- {full_path} is not listed by git, scanning the filesystem')
+            dirs_checked += find_in_path(full_path, filename, conf, results, _depth=depth, path_filter=path_filter,
+                                         found=found, merged_roots=merged_roots)
+
+    return dirs_checked + len([depth for depth in depths.values() if depth is not None])
@@ -0,0 +1,429 @@
+import os, gc, copy, json, time, pickle, hashlib, logging, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from . import log
+from .log import logger, deb, war, get_indent
+from .common import Error, find_in_path, get_key_filepath
+from .cachefile import JsonCacheFile, open_locked, replace_atomically
+from .pathfilter import PathFilter
+from .package import Package, Track, Layout
+from .version import Version
+from .errorcodes import ErrorCode
+from .exceptions import BadPackageFile, UnknownException
+
+
+def dictionary_is_valid(dictionary):
+    """
+    Since the package file can contain all sorts of stuff this helper will decide
+    if the dictionary blob is actually obsoleta specific.
+    """
+    try:
+        return dictionary.get('name') or dictionary.get('version') or dictionary.get('arch')
+    except:
+        return False
+
+
+def read_package_file(file):
+    try:
+        with open(file) as f:
+            _json = f.read()
+            return json.loads(_json)
+    except json.JSONDecodeError:
+        raise BadPackageFile(f'malformed json in {file}')
+
+
+class PackageCache(JsonCacheFile):
+    """
+    A persisted copy of the parsed package files, each recorded with the mtime, size and a hash of
+    the content of the file it was parsed from. A package file with the recorded mtime and size is
+    taken from the cache without being opened. Any other file is read and only parsed again if the
+    content hash has changed. Only the files read in the current run are written back by save(),
+    so deleted package files are dropped.
+    """
+    entries = 'files'
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.reused = 0
+        self.parsed = 0
+        self.changed = False
+        self.files = self.load()
+
+    def read(self, file):
+        """
+        Return the parsed json of the package file 'file', as read_package_file().
+        """
+        stat = os.stat(file)
+        recorded = self.files.get(file)
+        if recorded and recorded['mtime'] == stat.st_mtime_ns and recorded['size'] == stat.st_size:
+            self.reused += 1
+            self.visited[file] = recorded
+            return recorded['dictionary']
+
+        with open(file, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha1(content).hexdigest()
+        if recorded and recorded['hash'] == digest:
+            self.reused += 1
+            dictionary = recorded['dictionary']
+        else:
+            try:
+                dictionary = json.loads(content)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                raise BadPackageFile(f'malformed json in {file}')
+            self.parsed += 1
+
+        self.changed = True
+        if self.recordable(stat.st_mtime_ns):
+            self.visited[file] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': digest,
+                                  'dictionary': dictionary}
+        return dictionary
+
+    def save(self):
+        if self.changed or self.visited.keys() != self.files.keys():
+            super().save()
+
+
+class GraphCache:
+    """
+    The resolved packages in a file, so they can be used without parsing and resolving anything
+    as long as the same package files are found and they are all unchanged.
+
+    The file holds plain json data only, so a planted or damaged file can at worst make an invalid
+    graph. After a magic line comes a header line with the configuration and the package files and
+    the key files of slot packages together with their mtime and size, which is all that is needed
+    to tell if the graph is valid. The rest of the file is only read if it is. It holds a string
+    table, a version table and a record for each package, see 'fields', where packages are
+    referenced by their integer node id. The first nodes are the loaded packages. The dependencies
+    are a single array of node ids and the errors are records of their own. Packages with the same
+    version share the Version, which is never changed in place.
+    """
+    magic = b'obsoleta graph\n'
+    version = 2
+    # settings that don't change the resolved packages
+    ignored_settings = ('jobs', 'cache', 'lazy', 'scan_manifest', 'git_index')
+    # the Package attributes in a node record, followed by the number of dependencies and errors
+    fields = ('name', 'version', 'track', 'arch', 'buildtype', 'string', 'package_path', 'slot_key', 'layout',
+              'parent', 'direct_dependency', 'slot_unresolved', 'explicit_anyarch', 'keep_track',
+              'implicit_attributes', 'original_dict', 'package_section')
+    # the Package attributes not in 'fields'
+    derived_fields = ('conf', 'dependencies', 'errors')
+
+    def __init__(self, filename, conf):
+        self.filename = filename
+        self.conf = conf
+        self.settings = repr(sorted((key, value) for key, value in vars(conf).items()
+                                    if key not in self.ignored_settings))
+
+    @staticmethod
+    def stamps(files):
+        """
+        Return the list of [mtime, size], or None for a missing file, for the 'files'.
+        """
+        stamps = []
+        for file in files:
+            try:
+                stat = os.stat(file)
+                stamps.append([stat.st_mtime_ns, stat.st_size])
+            except FileNotFoundError:
+                stamps.append(None)
+        return stamps
+
+    def load(self, package_files):
+        """
+        Return the tuple ([packages], [indexes of the packages with circular dependencies]) if the
+        graph was saved from the same configuration and 'package_files', or None.
+        """
+        gc_enabled = gc.isenabled()
+        try:
+            with open_locked(self.filename, 'rb') as f:
+                if f.readline() != self.magic:
+                    war(f'ignoring invalid graph cache {self.filename}')
+                    return None
+                header = json.loads(f.readline())
+                if (header.get('version') != self.version or header['settings'] != self.settings or
+                        header['files'] != package_files or
+                        header['stamps'] != self.stamps(package_files + header['key_files'])):
+                    deb(f'graph cache {self.filename} is out of date')
+                    return None
+                # the collector only slows down making lots of objects that are all kept anyway
+                gc.disable()
+                graph = json.loads(f.read())
+            return self.construct(graph), graph['circular']
+        except FileNotFoundError:
+            deb(f'no graph cache found at {self.filename}')
+            return None
+        except Exception as e:
+            war(f'ignoring invalid graph cache {self.filename} ({str(e)})')
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def construct(self, graph):
+        """
+        Return the loaded packages from the 'graph' read by load(). All the other packages referenced
+        are constructed too.
+        """
+        strings = graph['strings']
+        versions = [Version(version) for version in graph['versions']]
+        tracks = list(Track)
+        layouts = list(Layout)
+        errorcodes = {errorcode.value: errorcode for errorcode in ErrorCode}
+        conf = self.conf
+        nodes = graph['nodes']
+        edges = graph['edges']
+        error_records = graph['errors']
+        # the packages are constructed first and then linked, as a node can reference any other node
+        packages = []
+        for (name, version, track, arch, buildtype, string, package_path, slot_key, layout, parent,
+             direct_dependency, slot_unresolved, explicit_anyarch, keep_track, implicit_attributes,
+             original_dict, package_section, dependency_count, error_count) in nodes:
+            attributes = {'name': strings[name], 'version': versions[version],
+                          'string': None if string is None else strings[string],
+                          'package_path': None if package_path is None else strings[package_path],
+                          'slot_key': None if slot_key is None else strings[slot_key], 'layout': layouts[layout],
+                          'direct_dependency': direct_dependency, 'slot_unresolved': slot_unresolved,
+                          'explicit_anyarch': explicit_anyarch, 'keep_track': keep_track,
+                          'implicit_attributes': implicit_attributes, 'original_dict': original_dict,
+                          # a section is recorded as the key of the part of the original_dict it is
+                          'package_section': original_dict[package_section] if isinstance(package_section, str)
+                          else package_section}
+            if conf.using_track:
+                attributes['track'] = tracks[track]
+            if conf.using_arch:
+                attributes['arch'] = strings[arch]
+            if conf.using_buildtype:
+                attributes['buildtype'] = strings[buildtype]
+            packages.append(Package.construct_from_cache(conf, attributes))
+        edge = 0
+        error = 0
+        for package, node in zip(packages, nodes):
+            parent, dependency_count, error_count = node[9], node[-2], node[-1]
+            if parent is not None:
+                package.parent = packages[parent]
+            package.dependencies = [packages[node] for node in edges[edge:edge + dependency_count]]
+            edge += dependency_count
+            if error_count is not None:
+                package.errors = [
+                    Error.construct_from_cache(errorcodes[errorcode],
+                                               None if error_package is None else packages[error_package],
+                                               message, key)
+                    for errorcode, error_package, message, key in error_records[error:error + error_count]]
+                error += error_count
+        return packages[:graph['count']]
+
+    def save(self, package_files, packages, circular):
+        """
+        Save the resolved 'packages' loaded from 'package_files' where the packages in 'circular' have
+        circular dependencies. Nothing is saved if a file was modified so recently that it might be
+        modified again without its mtime changing, see JsonCacheFile.racy_seconds.
+        """
+        key_files = sorted(set(get_key_filepath(package.get_path()) for package in packages
+                               if package.layout == Layout.slot))
+        stamps = self.stamps(package_files + key_files)
+        now = time.time_ns()
+        if any(now - stamp[0] <= JsonCacheFile.racy_seconds * 1000000000 for stamp in stamps if stamp):
+            deb('not saving the graph cache, package files were just modified')
+            return
+
+        # the node ids of all the packages reachable from the loaded packages, in the order found
+        nodes = {id(package): i for i, package in enumerate(packages)}
+        ordered = list(packages)
+        known_fields = set(self.fields + self.derived_fields)
+        for package in ordered:
+            if not known_fields.issuperset(vars(package)):
+                deb(f'not saving the graph cache, can\'t record {", ".join(set(vars(package)) - known_fields)}')
+                return
+            referenced = [package.parent] + package.dependencies + [error.package for error in package.errors or ()]
+            for other in referenced:
+                if other is not None and id(other) not in nodes:
+                    nodes[id(other)] = len(ordered)
+                    ordered.append(other)
+
+        strings = {}
+        versions = {}
+        records = []
+        edges = []
+        error_records = []
+
+        def string_id(string):
+            return None if string is None else strings.setdefault(string, len(strings))
+
+        for package in ordered:
+            original_dict = package.original_dict
+            section = package.package_section
+            if section is not None and isinstance(original_dict, dict):
+                section = next((key for key, value in original_dict.items() if value is section), section)
+            errors = package.errors
+            records.append([
+                string_id(package.name), versions.setdefault(str(package.version), len(versions)),
+                package.track.value if self.conf.using_track else None,
+                string_id(package.arch) if self.conf.using_arch else None,
+                string_id(package.buildtype) if self.conf.using_buildtype else None,
+                string_id(package.string), string_id(package.package_path), string_id(package.slot_key),
+                package.layout.value, None if package.parent is None else nodes[id(package.parent)],
+                package.direct_dependency, package.slot_unresolved, package.explicit_anyarch, package.keep_track,
+                package.implicit_attributes, original_dict, section,
+                len(package.dependencies), None if errors is None else len(errors)])
+            edges.extend(nodes[id(dependency)] for dependency in package.dependencies)
+            for error in errors or ():
+                error_package = None if error.package is None else nodes[id(error.package)]
+                error_records.append([error.errorcode.value, error_package, error.message, error.key[1]])
+
+        header = {'version': self.version, 'settings': self.settings, 'files': list(package_files),
+                  'key_files': key_files, 'stamps': stamps}
+        graph = {'count': len(packages), 'strings': list(strings), 'versions': list(versions), 'nodes': records,
+                 'edges': edges, 'errors': error_records, 'circular': [nodes[id(package)] for package in circular]}
+        with replace_atomically(self.filename, 'wb') as f:
+            f.write(self.magic)
+            f.write(json.dumps(header).encode() + b'\n')
+            f.write(json.dumps(graph).encode())
+
+
+def find_slot_keys(conf, file, path_filter=None):
+    """
+    Return the keys of the obsoleta.key files below the multislot package file 'file', which are
+    the slots of it when they aren't parsed directly.
+    """
+    key_files = []
+    key_conf = copy.deepcopy(conf)
+    key_conf.depth = 2
+    find_in_path(os.path.dirname(file), 'obsoleta.key', key_conf, key_files, path_filter=path_filter)
+    return [Package.load_key(key_file) for key_file in key_files]
+
+
+def construct_packages(conf, file, dictionary, path_filter=None, keys=None):
+    """
+    Return the list of packages in the package file 'file' with the parsed json 'dictionary'.
+    This is more than one package for a multislot package file, the slots are then found with
+    find_slot_keys() unless they are given in 'keys'.
+    """
+    if dictionary.get('multislot'):
+        if conf.parse_multislot_directly:
+            packages = []
+            for key in dictionary.keys():
+                if key != 'multislot' and dictionary_is_valid(dictionary[key]):
+                    packages.append(Package.construct_from_package_path(
+                        conf, file, key=key, dictionary=dictionary))
+            return packages
+
+        if keys is None:
+            keys = find_slot_keys(conf, file, path_filter)
+        return [Package.construct_from_package_path(conf, file, key=key, dictionary=dictionary) for key in keys]
+
+    return [Package.construct_from_package_path(conf, file, dictionary=dictionary), ]
+
+
+class RecordHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
+
+
+class ParsedFile:
+    """
+    The outcome of reading a single package file in a worker process: the parsed json, the slot keys
+    of a multislot package file with key files, and the exception if it failed. The log messages from
+    the worker are kept so they can be logged by the parent in the usual order.
+    """
+    def __init__(self, dictionary, keys, exception, records):
+        self.dictionary = dictionary
+        self.keys = keys
+        self.exception = exception
+        self.records = records
+
+    def result(self, conf, file, path_filter=None):
+        """
+        Log the messages from the worker and return the packages constructed from the package file
+        'file', or raise the exception the worker failed with.
+        """
+        for level, message in self.records:
+            logger.log(level, get_indent() + message)
+        if self.exception:
+            raise self.exception
+        return construct_packages(conf, file, self.dictionary, path_filter, self.keys)
+
+
+# the state of a worker process, see init_worker()
+worker_conf = None
+worker_path_filter = None
+worker_handler = None
+
+
+def init_worker(conf, level):
+    global worker_conf, worker_path_filter, worker_handler
+    worker_conf = conf
+    worker_path_filter = PathFilter.from_conf(conf)
+    worker_handler = RecordHandler()
+    logger.handlers = [worker_handler]
+    logger.setLevel(level)
+
+
+def parse_in_worker(task):
+    """
+    Read the package file of 'task' unless its json is given, and find the slot keys if it is a
+    multislot package file with key files. The packages are constructed by the parent, only plain
+    data is sent back.
+    """
+    file, given = task
+    worker_handler.records = []
+    log.reset_indent()
+    dictionary = given
+    keys = exception = None
+    try:
+        if dictionary is None:
+            dictionary = read_package_file(file)
+        if dictionary.get('multislot') and not worker_conf.parse_multislot_directly:
+            keys = find_slot_keys(worker_conf, file, worker_path_filter)
+    except Exception as e:
+        exception = e
+
+    # the parent already has the json it gave
+    returned = None if given is not None else dictionary
+    try:
+        return pickle.dumps((returned, keys, exception, worker_handler.records), pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        exception = UnknownException(f'unable to return the result of parsing {file}: {str(e)}')
+        return pickle.dumps((None, None, exception, worker_handler.records), pickle.HIGHEST_PROTOCOL)
+
+
+def pool_context():
+    """
+    Return the multiprocessing context for the process pool. Workers are forked where possible, a
+    spawned or forkserver worker imports the main module of the parent again, e.g. obsoleta.py.
+    A process with other threads running, e.g. the watcher of --serve, isn't forked since the child
+    would only get the forking thread and could deadlock on a lock another thread was holding.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if threading.active_count() == 1 and 'fork' in methods:
+        return multiprocessing.get_context('fork')
+    if 'forkserver' in methods:
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def parse_in_processes(conf, files, dictionaries, jobs):
+    """
+    Read the package 'files' in a pool of 'jobs' processes and return a dictionary
+    file -> ParsedFile. Already parsed json can be given in 'dictionaries'.
+    Returns an empty dictionary if the process pool can't be used.
+    """
+    tasks = [(file, dictionaries.get(file)) for file in files]
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=pool_context(), initializer=init_worker,
+                                 initargs=(conf, logger.level)) as pool:
+            results = list(pool.map(parse_in_worker, tasks, chunksize=chunksize))
+    except (OSError, BrokenProcessPool) as e:
+        war(f'parsing in processes failed ({str(e)}), parsing sequentially')
+        return {}
+
+    parsed_files = {}
+    for (file, given), result in zip(tasks, results):
+        dictionary, keys, exception, records = pickle.loads(result)
+        parsed_files[file] = ParsedFile(given if given is not None else dictionary, keys, exception, records)
+    return parsed_files
@@ -1,22 +1,25 @@
-import logging, sys
+import logging, sys, threading
 from .errorcodes import ErrorCode
 
-indent_string = ''
+# the indentation of the log messages. It is kept per thread so queries running in parallel on a
+# frozen model don't indent each other's messages.
+indentation = threading.local()
 
 
 def indent():
-    global indent_string
-    indent_string += '  '
+    indentation.string = get_indent() + '  '
 
 
 def unindent():
-    global indent_string
-    indent_string = indent_string[:-2]
+    indentation.string = get_indent()[:-2]
+
+
+def reset_indent():
+    indentation.string = ''
 
 
 def get_indent():
-    global indent_string
-    return indent_string
+    return getattr(indentation, 'string', '')
 
 
 RESET = '\033[0m'
@@ -26,7 +29,9 @@ handler = logging.StreamHandler(sys.stdout)
 formatter = logging.Formatter(f'%(levelname)s %(message)s{RESET}')
 handler.setFormatter(formatter)
 logger.addHandler(handler)
-logger.setLevel(logging.WARNING)
+# the level when neither verbose nor info is asked for
+default_level = logging.WARNING
+logger.setLevel(default_level)
 logger.propagate = False
 
 
@@ -64,7 +69,7 @@ def set_log_level(verbose=False, info=False):
 def deb(msg, newline=True):
     if not newline:
         handler.terminator = ""
-    logger.debug(indent_string + msg)
+    logger.debug(get_indent() + msg)
     if not newline:
         handler.terminator = "\n"
 
@@ -72,7 +77,7 @@ def deb(msg, newline=True):
 def inf(msg, newline=True):
     if not newline:
         handler.terminator = ""
-    logger.info(indent_string + msg)
+    logger.info(get_indent() + msg)
     if not newline:
         handler.terminator = "\n"
 
@@ -80,7 +85,7 @@ def inf(msg, newline=True):
 def inf_alt(msg, newline=True):
     if not newline:
         handler.terminator = ""
-    logger.info(indent_string + '\033[37m\033[44m' + msg)
+    logger.info(get_indent() + '\033[37m\033[44m' + msg)
     if not newline:
         handler.terminator = "\n"
 
@@ -88,17 +93,17 @@ def inf_alt(msg, newline=True):
 def inf_alt2(msg, newline=True):
     if not newline:
         handler.terminator = ""
-    logger.info(indent_string + '\033[37m\033[100m' + msg)
+    logger.info(get_indent() + '\033[37m\033[100m' + msg)
     if not newline:
         handler.terminator = "\n"
 
 
 def war(msg):
-    logger.warning(indent_string + msg)
+    logger.warning(get_indent() + msg)
 
 
 def err(msg):
-    logger.error(indent_string + msg)
+    logger.error(get_indent() + msg)
 
 
 def cri(msg, exit_code=ErrorCode.UNSET):
@@ -1,10 +1,11 @@
 import copy
 
-import os
+import shutil
 from .obsoletacore import Obsoleta, UpDownstreamFilter
 from .package import Package
-from .common import ErrorOk, Args
+from .common import Error, ErrorOk, Args
 from .errorcodes import ErrorCode
+from .exceptions import ObsoletaException
 
 
 class ObsoletaApi:
@@ -13,8 +14,35 @@ class ObsoletaApi:
         self.args = args
         self.obsoleta = Obsoleta(self.conf, self.args)
 
+    def reload(self, package_files, changed_files=()):
+        """
+        Rebuild the model from the package files 'package_files' where only the files listed in
+        'changed_files' (and new files) are parsed again. See Obsoleta.reload().
+        """
+        self.obsoleta.reload(package_files, changed_files)
+
+    def reloaded(self, package_files=None, changed_files=()):
+        """
+        As reload() but the model is rebuilt in a new ObsoletaApi which is returned, while this one is
+        left unchanged for the queries still using it. See Obsoleta.reloaded().
+        """
+        api = copy.copy(self)
+        api.obsoleta = self.obsoleta.reloaded(package_files, changed_files)
+        return api
+
+    def freeze(self):
+        """
+        Make the model read only so this ObsoletaApi can be queried from several threads at once.
+        Changes are then made with reloaded(). See Obsoleta.freeze(). Returns self.
+        """
+        self.obsoleta.freeze()
+        return self
+
     def clear_cache(self):
-        os.remove(Obsoleta.default_cache_filename())
+        """
+        Delete the cache files and the scan manifest of the roots and configuration of this model.
+        """
+        shutil.rmtree(self.obsoleta.cache_dir, ignore_errors=True)
 
     def serialize(self):
         return self.obsoleta.serialize()
@@ -80,6 +108,37 @@ class ObsoletaApi:
             result = resolved
         return [ErrorOk()], result
 
+    def buildwaves(self, package_or_compact, printpaths=False):
+        """
+        Returns ([errors], [build waves]) where each build wave is a list of packages, or paths with
+        'printpaths', that can be built concurrently once the packages in the previous waves are built.
+        """
+        package_or_compact = Package.auto_package(self.conf, package_or_compact)
+
+        errors, waves = self.obsoleta.dump_build_waves(package_or_compact)
+
+        if errors[0].has_error():
+            return errors, None
+        if printpaths:
+            waves = [[_package.get_path() for _package in wave] for wave in waves]
+        return [ErrorOk()], waves
+
+    def buildplan(self, package_or_compact, workers, timings=None):
+        """
+        Returns ([errors], BuildPlan) with a schedule for building the build order on 'workers' workers,
+        see buildplan.py. 'timings' is an optional dictionary with build times as read by load_timings().
+        """
+        package_or_compact = Package.auto_package(self.conf, package_or_compact)
+        if workers < 1:
+            return [Error(ErrorCode.MISSING_INPUT, package_or_compact,
+                          f'the build plan needs at least 1 worker, got {workers}')], None
+
+        errors, plan = self.obsoleta.dump_build_plan(package_or_compact, workers, timings)
+
+        if errors[0].has_error():
+            return errors, None
+        return [ErrorOk()], plan
+
     def print(self, package_or_compact):
         """
         Returns (error, dictionary)
@@ -219,11 +278,133 @@ class ObsoletaApi:
             Param: 'dryrun'. Dont actually modify any files, just write what would have been done.
             Returns: tuple(errorcode, [informational text messages])
 
-            The implementation is found in obsoleta_bump.py.
+            The implementation is found in obsoleta_bump.py. Raises ModelFrozen if the model is frozen
+            since bumping also changes the loaded packages, even with 'dryrun'.
         """
-
+        self.obsoleta.check_writable('bump packages in')
         return self.bump_impl(package_or_compact,
                               new_version,
                               bump=bump,
                               dryrun=dryrun,
                               indent_messages=indent_messages)
+
+    def run_batch(self, queries):
+        """ Run a stream of queries on the loaded model and yield the result of each query as soon
+            as it is done. A failing query doesn't stop the batch.
+            Param: 'queries' is an iterable of dictionaries {'command', 'package', 'options'}, see run_query().
+            Returns: generator of result dictionaries, see run_query().
+        """
+        for query in queries:
+            yield self.run_query(query)
+
+    def run_query(self, query):
+        """ Run a single batch query and return the result as a dictionary of json types.
+            Param: 'query' is a dictionary with
+                'command': one of check, tree, buildorder, buildwaves, buildplan, upstream, downstream,
+                           listmissing, listmissingfull, print or printarchs as the obsoleta.py commands.
+                'package': the package in compact form. Not used for printarchs.
+                'options': optional dictionary. 'path' (and 'key') gives the package as a path rather
+                           than 'package', 'printpaths' gives paths rather than packages for buildorder,
+                           buildwaves and buildplan and 'workers' is the number of workers for buildplan.
+            Returns: {'command', 'package', 'errorcode': int, 'errors': [error strings], 'result'}. The
+                     errorcode is the exit code obsoleta.py would have given for the command.
+        """
+        command = query.get('command')
+        options = query.get('options') or {}
+        response = {'command': command, 'package': query.get('package'), 'errorcode': ErrorCode.OK.value,
+                    'errors': [], 'result': None}
+
+        def name(_package):
+            return _package.get_path() if options.get('printpaths') else _package.to_string()
+
+        def fail(errorcode, errors):
+            response['errorcode'] = errorcode.value
+            response['errors'].extend(errors)
+            return response
+
+        def package_errors(packages):
+            for _package in packages:
+                for _error in _package.get_errors() or []:
+                    fail(_error.get_errorcode(), [_error.to_string()])
+
+        try:
+            package = None
+            if command != 'printarchs':
+                if options.get('path'):
+                    package = Package.construct_from_package_path(self.conf, options['path'], key=options.get('key'))
+                elif query.get('package'):
+                    package = Package.construct_from_compact(self.conf, query['package'])
+                else:
+                    return fail(ErrorCode.MISSING_INPUT, ['no package specified'])
+
+            if command == 'check':
+                error, errors = self.obsoleta.get_errors(package)
+                if error.get_errorcode() == ErrorCode.PACKAGE_NOT_FOUND:
+                    return fail(error.get_errorcode(), [error.get_message()])
+                for error in errors:
+                    fail(error.get_errorcode(), [error.to_string()])
+
+            elif command == 'tree':
+                error, result = self.tree(package)
+                if error.has_error():
+                    return fail(error.get_errorcode(), [error.print()])
+                response['result'] = result
+
+            elif command == 'buildorder':
+                errors, resolved = self.buildorder(package)
+                if errors[0].has_error():
+                    return fail(errors[0].get_errorcode(), [error.get_message() for error in errors])
+                response['result'] = [name(_package) for _package in resolved]
+                package_errors(resolved)
+
+            elif command == 'buildwaves':
+                errors, waves = self.buildwaves(package)
+                if errors[0].has_error():
+                    return fail(errors[0].get_errorcode(), [error.get_message() for error in errors])
+                response['result'] = [[name(_package) for _package in wave] for wave in waves]
+                package_errors(_package for wave in waves for _package in wave)
+
+            elif command == 'buildplan':
+                errors, plan = self.buildplan(package, int(options.get('workers', 1)))
+                if not plan:
+                    return fail(errors[0].get_errorcode(), [error.get_message() for error in errors])
+                response['result'] = {
+                    'steps': [[step.start, step.end, step.worker, name(step.package)] for step in plan.steps],
+                    'critical_path': [name(_package) for _package in plan.critical_path],
+                    'critical_path_time': plan.critical_path_time,
+                    'total_time': plan.total_time}
+                package_errors(step.package for step in plan.steps)
+
+            elif command in ('upstream', 'downstream'):
+                locate = self.upstreams if command == 'upstream' else self.downstreams
+                error, lookup = locate(package)
+                if error.has_error():
+                    return fail(ErrorCode.PACKAGE_NOT_FOUND, [f'unable to locate {command} {package}'])
+                response['result'] = [_package.get_path() for _package in lookup]
+
+            elif command == 'listmissing':
+                _error, missing_list = self.list_missing(package)
+                response['result'] = [missing.to_string() for missing in missing_list]
+
+            elif command == 'listmissingfull':
+                _error, response['result'] = self.list_missing_full(package)
+
+            elif command == 'print':
+                error, response['result'] = self.print(package)
+                if error.has_error():
+                    return fail(error.get_errorcode(), [error.print()])
+
+            elif command == 'printarchs':
+                _error, response['result'] = self.get_all_archs()
+
+            else:
+                return fail(ErrorCode.MISSING_INPUT, [f'unknown command "{command}"'])
+
+        except ObsoletaException as e:
+            return fail(e.ErrorCode, [str(e)])
+        except FileNotFoundError as e:
+            return fail(ErrorCode.PACKAGE_NOT_FOUND, [str(e)])
+        except Exception as e:
+            return fail(ErrorCode.UNKNOWN_EXCEPTION, [f'command gave unexpected exception: {str(e)}'])
+
+        return response
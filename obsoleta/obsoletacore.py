@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
-import os, copy, collections, json, html, datetime
+import os, copy, collections, heapq, html, datetime
 from enum import Enum
 from .log import deb, inf, inf_alt, inf_alt2, war, err, get_info_log_level, indent, unindent
 from .common import Error, ErrorOk, printing_path
 from .common import find_in_path
+from .gitindex import find_in_git_index
+from .loader import read_package_file, construct_packages, parse_in_processes, PackageCache, GraphCache
+from .cachefile import cache_namespace
+from .scanner import Scanner, Manifest, ParsePipeline
+from .pathfilter import PathFilter
+from .traversal import Walk, ENTER, preorder
+from .buildplan import build_cost, make_build_plan
 from .version import Version
-from .exceptions import PackageNotFound, BadPackageFile, MissingKeyFile, DuplicatePackage
+from .exceptions import PackageNotFound, BadPackageFile, MissingKeyFile, DuplicatePackage, ModelFrozen
 from .errorcodes import ErrorCode
 from .package import Package, anyarch, buildtype_unknown, Track
 
@@ -17,47 +24,152 @@ class UpDownstreamFilter(Enum):
 
 
 class Obsoleta:
+    # the minimum number of package files for parsing them in a process pool when conf.jobs > 1
+    parallel_load_threshold = 200
+    # settings that only tell if and how the cache files are used, see construct_cache_dir()
+    cache_ignored_settings = ('jobs', 'cache', 'scan_manifest', 'cache_dir')
+
     def __init__(self, conf, args):
         self.conf = conf
         self.args = args
         self.dirs_checked = 0
         self.roots = self.construct_root_list()
         self.conf.root = min(self.roots, key=len)
-        self.package_files = self.find_package_files(self.roots)
+        self.cache_dir = self.construct_cache_dir()
         self.loaded_packages = []
-
+        # the loaded packages by name, see add_loaded_package() and candidates()
+        self.packages_by_name = {}
+        # the ids of the packages with circular dependencies, see find_circular_dependencies()
+        self.circular = set()
+        # the outcome of aggregating the attributes of each package, see aggregate_attributes()
+        self.aggregated = {}
+        # the parsed json of the package files, see reload()
+        self.package_dictionaries = {}
+        # the names of the packages not resolved yet with conf.lazy, see resolve_subgraph()
+        self.unresolved_names = set()
+        # the reverse dependencies, built when first needed, see index_downstreams()
+        self.downstream_index = None
+        # the errors found in the tree of each package, see error_summary()
+        self.error_summaries = {}
+        # a frozen model is not changed by queries, see freeze()
+        self.frozen = False
+
+        # the package files are parsed while the scan is running unless they are likely to
+        # be taken from the cache instead
+        pipeline = None if conf.cache else ParsePipeline(conf.jobs)
         try:
-            if conf.cache:
-                try:
-                    deb('loading from cache')
-                    self.load_cache()
-                    return
-                except:
-                    deb('loading from cache failed')
-        except:
-            pass
+            self.package_files = self.find_package_files(self.roots, pipeline)
+        finally:
+            if pipeline:
+                self.package_dictionaries = pipeline.close()
+
+        cache = None
+        if conf.cache:
+            graph = GraphCache(self.cache_filename('obsoleta.graph'), conf)
+            if self.load_graph(graph):
+                return
+            cache = PackageCache(self.cache_filename('obsoleta.cache'))
+            self.package_dictionaries = self.read_cached_package_files(cache, self.package_files)
 
         self.load(self.package_files)
+        self.resolve()
+
+        if cache:
+            cache.save()
+            # the graph is only valid for the key files next to the package files, see GraphCache
+            if not self.unresolved_names and conf.parse_multislot_directly:
+                graph.save(self.package_files, self.loaded_packages,
+                           [package for package in self.loaded_packages if id(package) in self.circular])
 
+    def resolve(self):
+        """
+        Resolve all the loaded packages, or with conf.lazy only prepare for resolving the packages
+        on demand, see resolve_subgraph().
+        """
+        self.check_writable('resolve')
         if not self.loaded_packages:
             raise PackageNotFound("didn't find any packages")
 
         self.loaded_packages.sort()
-        for package in self.loaded_packages:
-            if self.resolve_dependencies(package):
-                self.aggregate_attributes(package)
-            else:
+        self.index_loaded_packages()
+
+        self.circular = set()
+        self.resolved_specs = {}
+        self.resolved_candidates = {}
+        self.aggregated = {}
+        self.unresolved_names = set(self.packages_by_name)
+        self.downstream_index = None
+        self.error_summaries = {}
+
+        if self.conf.lazy:
+            deb('lazy resolve, packages are resolved when queried')
+        else:
+            self.resolve_packages(self.loaded_packages)
+
+    def resolve_subgraph(self, package=None):
+        """
+        With conf.lazy resolve the loaded packages that can be reached from packages with the name of
+        'package', or all of them if 'package' is None. The packages reached are all the packages
+        with the names found following the dependencies by name, so the circular dependencies found
+        are the same as when resolving everything. Packages resolved once stay resolved.
+        """
+        if not self.unresolved_names:
+            return
+
+        if package is None or package.get_name() == '*' or '*' in self.packages_by_name:
+            names = set(self.unresolved_names)
+        else:
+            names = set()
+            pending = [package.get_name()]
+            while pending:
+                name = pending.pop()
+                if name in names or name not in self.unresolved_names:
+                    continue
+                names.add(name)
+                for _package in self.packages_by_name[name]:
+                    for dependency in _package.get_dependencies() or []:
+                        if dependency.get_name() == '*':
+                            pending.extend(self.unresolved_names)
+                        else:
+                            pending.append(dependency.get_name())
+
+        packages = sorted((_package for name in names for _package in self.packages_by_name[name]),
+                          key=lambda _package: self.loaded_index[id(_package)])
+        if packages:
+            self.resolve_packages(packages)
+
+    def resolve_packages(self, packages):
+        """
+        Resolve the loaded 'packages', which must include all the packages with the names reachable from them.
+        """
+        self.check_writable('resolve')
+        self.unresolved_names.difference_update(package.get_name() for package in packages)
+        self.downstream_index = None
+        # resolving can add errors to packages resolved earlier
+        self.error_summaries = {}
+        self.circular.update(self.find_circular_dependencies(packages))
+
+        for package in packages:
+            if id(package) in self.circular:
                 err(f'attribute aggregation skipped due to errors in {package.to_string()}')
+                continue
+            self.resolve_dependencies(package)
+
+        for package in packages:
+            if id(package) not in self.circular:
+                self.aggregate_attributes(package)
+
+        self.set_lookups()
 
         if not self.conf.allow_duplicates:
-            self.check_for_multiple_versions()
+            self.check_for_multiple_versions(packages)
         else:
             deb('ignore duplicates, not running "check_for_multiple_versions"')
 
-        inf(f'loading and parsing complete with {self.get_error_count()} errors')
-        if args.verbose:
+        inf(f'loading and parsing complete with {self.get_error_count(packages)} errors')
+        if self.args.verbose:
             indent()
-            for package in self.loaded_packages:
+            for package in packages:
                 _, errors = self.get_errors(package)
                 if errors:
                     err(f'errors in {package.to_extra_string()}')
@@ -67,18 +179,71 @@ class Obsoleta:
                     unindent()
             unindent()
 
-        if conf.cache:
-            self.write_cache()
+    def reload(self, package_files, changed_files=()):
+        """
+        Rebuild the model from 'package_files'. Only the package files listed in 'changed_files',
+        and files not seen before, are read and parsed again, the rest are constructed from the
+        json parsed earlier. Since resolving mutates the packages the resolve itself is always
+        made from scratch.
+        """
+        self.check_writable('reload')
+
+        for file in changed_files:
+            self.package_dictionaries.pop(file, None)
+        for file in set(self.package_dictionaries) - set(package_files):
+            del self.package_dictionaries[file]
+
+        self.package_files = package_files
+        self.loaded_packages = []
+        self.packages_by_name = {}
+        self.load(package_files)
+        self.resolve()
+
+    def reloaded(self, package_files=None, changed_files=()):
+        """
+        Return a new model rebuilt as reload() would, by default from the same package files, while this
+        model is left unchanged and can still be queried. The new model is frozen if this one is.
+        """
+        obsoleta = copy.copy(self)
+        obsoleta.package_dictionaries = dict(self.package_dictionaries)
+        obsoleta.frozen = False
+        obsoleta.reload(self.package_files if package_files is None else package_files, changed_files)
+        if self.frozen:
+            obsoleta.freeze()
+        return obsoleta
+
+    def freeze(self):
+        """
+        Resolve whatever is left to resolve with conf.lazy and make the indexes and summaries that are
+        otherwise made when first needed. After this queries only read the model, so a frozen model can
+        be queried from several threads at once. Changes are made to a new model, see reloaded().
+        Returns self.
+        """
+        self.resolve_subgraph()
+        if self.downstream_index is None:
+            self.downstream_index = self.index_downstreams()
+        for package in self.loaded_packages:
+            self.error_summary(package)
+        self.frozen = True
+        return self
+
+    def check_writable(self, action):
+        """
+        Raise ModelFrozen if the model is frozen, 'action' is what was attempted. Every change of
+        the model must check this first since other threads might be querying a frozen model.
+        """
+        if self.frozen:
+            raise ModelFrozen(f'can\'t {action} a frozen model, make the change with reloaded()')
 
     def construct_root_list(self):
         """
         Return the net root list of paths to scan from all the various sources
         and remove any duplicates.
-        Would-be duplicates seperated by more than conf.depth directories
-        are kept.
-        Note that there is a grey zone where a specified root path will be removed
-        since it is in itself covered by a parent path, but will now not be scanned
-        in a depth according to conf.depth as would be expected. This should be fixed.
+        A root path that is within conf.depth directories of another root path is merged
+        into it, i.e. it is removed from the list and recorded in 'self.merged_roots' as
+        child -> parent. The scan restarts with the full conf.depth when it enters a merged
+        root so it is still scanned as deep as if it had been given alone.
+        Would-be duplicates seperated by more than conf.depth directories are kept.
         """
         try:
             roots = self.args.root.split(os.pathsep)
@@ -90,111 +255,135 @@ class Obsoleta:
             self.conf.blacklist_paths += blacklist_paths
         except:
             pass
+        try:
+            blacklist_globs = self.args.blacklist_globs.split(os.pathsep)
+            self.conf.blacklist_globs += blacklist_globs
+        except:
+            pass
         roots.append(os.getenv('OBSOLETA_ROOT', ''))
         roots += self.conf.paths
         roots = [os.path.abspath(p) for p in roots if p]  # fully qualified non-empty paths
 
-        # prepare to remove any duplicate paths, both literally as well as paths already
-        # covered by a parent path.
-        roots = sorted(roots, key=len)
-        to_delete = []
-
-        # in order to complicate things then paths separated by a distance longer than
-        # the current Conf.depth should both be preserved.
-        for i in range(len(roots)):
-            for j in range(i+1, len(roots)):
-                check = [roots[i], roots[j]]
-                check.sort(key=len)
-                first, second = check
-                common = os.path.commonpath(check)
-
-                if common == first:
-                    difference_path = second.replace(common, '')
-                    difference_path = difference_path[1:]
-                    distance = difference_path.count('/')
-                    if distance < self.conf.depth:
-                        to_delete.append(second)
-
-        for delete in to_delete:
-            inf(f'removing duplicate path {delete} from list of root paths')
-            roots.remove(delete)
+        # a trie of path components where the nodes that are roots themselves are marked
+        # with their path. Parents are inserted before children so a root only needs to look
+        # for its nearest parent root on the way down.
+        for duplicate in [root for root, count in collections.Counter(roots).items() if count > 1]:
+            inf(f'removing duplicate path {duplicate} from list of root paths')
+        roots = sorted(dict.fromkeys(roots), key=len)
+        trie = {}
+        self.merged_roots = {}
+        for root in sorted(roots, key=lambda path: path.count(os.sep)):
+            components = [component for component in root.split(os.sep) if component]
+            node = trie
+            parent = None
+            for level, component in enumerate(components):
+                if None in node:
+                    parent = node[None], level
+                node = node.setdefault(component, {})
+            if None in node:
+                parent = node[None], len(components)
+
+            if parent:
+                parent_root, parent_level = parent
+                if len(components) - parent_level <= self.conf.depth:
+                    inf(f'merging root path {root} into {parent_root}')
+                    self.merged_roots[root] = parent_root
+            # merged roots are scanned with the full depth as well so they are parents too
+            node[None] = root
+
+        roots = [root for root in roots if root not in self.merged_roots]
 
         if not roots:
             roots = '.'
         return roots
 
-    def find_package_files(self, roots):
+    def find_package_files(self, roots, pipeline=None):
+        """
+        Return the package files below 'roots' in search order. If a ParsePipeline is given
+        then each file is fed to it as soon as it is found.
+        """
         inf(f'searching {len(roots)} roots')
         indent()
         package_files = []
-        for root in roots:
-            inf(f'path = {root}')
-            self.dirs_checked = find_in_path(root, 'obsoleta.json', self.conf, package_files)
+        found = pipeline.put if pipeline else None
+        self.path_filter = PathFilter.from_conf(self.conf)
+        if self.conf.git_index:
+            for root in roots:
+                inf(f'path = {root} (using the git index)')
+                self.dirs_checked = find_in_git_index(root, 'obsoleta.json', self.conf, package_files,
+                                                      path_filter=self.path_filter, found=found,
+                                                      merged_roots=self.merged_roots)
+        elif self.conf.jobs > 1 or self.conf.scan_manifest:
+            inf(f'paths = {", ".join(roots)} (scanning with {self.conf.jobs} jobs)')
+            manifest = None
+            if self.conf.scan_manifest:
+                manifest = Manifest(self.cache_filename('obsoleta.manifest'))
+            scanner = Scanner(self.conf, manifest=manifest, path_filter=self.path_filter, found=found,
+                              merged_roots=self.merged_roots)
+            package_files = scanner.scan(roots)
+            self.dirs_checked = scanner.dirs_checked
+            if manifest:
+                inf(f'manifest reused {manifest.reused} directories, {manifest.rescanned} were rescanned')
+                manifest.save()
+        else:
+            for root in roots:
+                inf(f'path = {root}')
+                self.dirs_checked = find_in_path(root, 'obsoleta.json', self.conf, package_files,
+                                                 path_filter=self.path_filter, found=found,
+                                                 merged_roots=self.merged_roots)
 
         inf(f'found {len(package_files)} package files in {self.dirs_checked} directories')
+        for rule, count in self.path_filter.pruned_summary():
+            inf(f'blacklist "{rule}" pruned {count} directories')
         unindent()
         return package_files
 
-    def get_duplicates_by_name(self, package_list):
-        if not package_list:
-            return []
-        names = [p.get_name() for p in package_list]
-        names = [name for name, count in collections.Counter(names).items() if count > 1]
-        return names
+    def parse_package_file(self, file):
+        dictionary = self.package_dictionaries.get(file)
+        if dictionary is None:
+            dictionary = read_package_file(file)
+            self.package_dictionaries[file] = dictionary
+        return construct_packages(self.conf, file, dictionary, self.path_filter)
 
-    def dictionary_is_valid(self, dictionary):
+    def parse_package_files(self, json_files):
         """
-        Since the package file can contain all sorts of stuff this helper will decide
-        if the dictionary blob is actually obsoleta specific.
+        Parse the package files in a process pool if there are enough of them to make it
+        worthwhile. Returns a dictionary file -> ParsedFile, which is empty if they are to be
+        parsed sequentially.
         """
-        try:
-            return dictionary.get('name') or dictionary.get('version') or dictionary.get('arch')
-        except:
-            return False
+        if self.conf.jobs < 2 or len(json_files) < self.parallel_load_threshold:
+            return {}
+        inf(f'parsing {len(json_files)} package files with {self.conf.jobs} processes')
+        parsed_files = parse_in_processes(self.conf, json_files, self.package_dictionaries, self.conf.jobs)
+        for file, parsed_file in parsed_files.items():
+            if parsed_file.dictionary is not None:
+                self.package_dictionaries[file] = parsed_file.dictionary
+        return parsed_files
 
     def load(self, json_files):
+        self.check_writable('load packages into')
         json_files = sorted(json_files)
+        parsed_files = self.parse_package_files(json_files)
         for file in json_files:
             inf_alt2(f'loading {printing_path(file, self.conf)}:')
             indent()
             try:
                 try:
-                    try:
-                        with open(file) as f:
-                            _json = f.read()
-                            dictionary = json.loads(_json)
-                    except json.JSONDecodeError:
-                        raise BadPackageFile(f'malformed json in {file}')
-
-                    if dictionary.get('multislot'):
-                        if self.conf.parse_multislot_directly:
-                            packages = []
-                            for key in dictionary.keys():
-                                if key != 'multislot' and self.dictionary_is_valid(dictionary[key]):
-                                    packages.append(Package.construct_from_package_path(
-                                        self.conf, file, key=key, dictionary=dictionary))
-                        else:
-                            key_files = []
-                            path = os.path.dirname(file)
-                            conf = copy.deepcopy(self.conf)
-                            conf.depth = 2
-                            find_in_path(path, 'obsoleta.key', conf, key_files)
-                            packages = [
-                                Package.construct_from_package_path(
-                                    self.conf, file, keypath=key_path, dictionary=dictionary)
-                                for key_path in key_files]
+                    if file in parsed_files:
+                        packages = parsed_files[file].result(self.conf, file, self.path_filter)
                     else:
-                        packages = [Package.construct_from_package_path(self.conf, file, dictionary=dictionary), ]
+                        packages = self.parse_package_file(file)
 
                 except (BadPackageFile, MissingKeyFile) as e:
                     if self.conf.keepgoing:
                         war('keep going is set, ignoring invalid package %s' % file)
+                        unindent()
                         continue
                     raise e
 
                 # multislot packages have more than one package from construction above
                 for package in packages:
-                    duplicates = package.find_equals_no_upgrade(self.loaded_packages)
+                    duplicates = package.find_equals_no_upgrade(self.candidates(package))
                     if duplicates:
                         message = ''
                         for duplicate in list([package]) + duplicates:
@@ -202,7 +391,7 @@ class Obsoleta:
                                        (str(duplicate), printing_path(duplicate.get_path(), self.conf)))
                         raise DuplicatePackage(message)
 
-                    dupe = package.find_equals_no_upgrade(self.loaded_packages)
+                    dupe = package.find_equals_no_upgrade(self.candidates(package))
                     if dupe:
                         message = 'duplicate package %s in %s, already exists as %s' % \
                                   (package, package.package_path, dupe[0].package_path)
@@ -214,11 +403,11 @@ class Obsoleta:
                             if self.conf.keepgoing:
                                 reason += ' (keepgoing)'
                             war('ignoring ' + message + reason)
-                            self.loaded_packages.append(package)
+                            self.add_loaded_package(package)
                         else:
                             raise DuplicatePackage(message)
                     else:
-                        self.loaded_packages.append(package)
+                        self.add_loaded_package(package)
 
             except Exception as e:
                 if self.conf.keepgoing:
@@ -227,59 +416,138 @@ class Obsoleta:
                     raise e
             unindent()
 
-    def resolve_dependencies(self, package, level=0):
-        if level == 0:
-            inf_alt('resolving ' + str(package))
-        else:
-            inf('resolving dependency ' + str(package))
+    def find_circular_dependencies(self, packages):
+        """
+        Find the strongly connected components (Tarjan) of the dependencies by name of the loaded 'packages'.
+        A '*' dependency might be anything and depends on all names.
+        Every loaded package in a component with a cycle, depending on a name in the same component, gets a
+        CIRCULAR_DEPENDENCY error with the shortest cycle through it and the full list of names in the
+        component. Returns the ids of these packages, they are left unresolved.
+        """
+        graph = {}
+        for package in packages:
+            graph.setdefault(package.get_name(), set())
+        for package in packages:
+            for dependency in package.get_dependencies() or []:
+                if dependency.get_name() == '*':
+                    graph[package.get_name()].update(graph)
+                elif dependency.get_name() in graph:
+                    graph[package.get_name()].add(dependency.get_name())
+
+        index, lowlink = {}, {}
+        stack, on_stack = [], set()
+        components = {}
+
+        def upstreams(name):
+            for upstream in sorted(graph[name]):
+                if upstream not in index:
+                    yield upstream
+                    lowlink[name] = min(lowlink[name], lowlink[upstream])
+                elif upstream in on_stack:
+                    lowlink[name] = min(lowlink[name], index[upstream])
+
+        for start in sorted(graph):
+            if start in index:
+                continue
+            for step, name in Walk(start, upstreams):
+                if step == ENTER:
+                    index[name] = lowlink[name] = len(index)
+                    stack.append(name)
+                    on_stack.add(name)
+                elif lowlink[name] == index[name]:
+                    component = []
+                    while not component or component[-1] != name:
+                        component.append(stack.pop())
+                        on_stack.discard(component[-1])
+                    if len(component) > 1 or name in graph[name]:
+                        for member in component:
+                            components[member] = sorted(component)
+
+        circular = set()
+        for package in packages:
+            component = components.get(package.get_name())
+            if not component:
+                continue
+            dependencies = set()
+            for dependency in package.get_dependencies() or []:
+                if dependency.get_name() == '*':
+                    dependencies.update(component)
+                elif dependency.get_name() in component:
+                    dependencies.add(dependency.get_name())
+            if not dependencies:
+                continue
+
+            cycle = self.shortest_cycle(graph, component, package.get_name(), dependencies)
+            message = ' -> '.join(cycle)
+            if len(component) > len(cycle) - 1:
+                message += f', cycles between {", ".join(component)}'
+            inf(f'circular dependency found for package {package.to_string()}: {message}')
+            package.add_error(Error(ErrorCode.CIRCULAR_DEPENDENCY, package, message))
+            circular.add(id(package))
+        return circular
 
+    @staticmethod
+    def shortest_cycle(graph, component, name, dependencies):
+        """
+        Breadth first search from the 'dependencies' of 'name' back to 'name' within the strongly
+        connected 'component'. Returns the names in the cycle starting and ending with 'name'.
+        """
+        previous = {dependency: name for dependency in sorted(dependencies)}
+        queue = collections.deque(sorted(dependencies))
+        while queue:
+            current = queue.popleft()
+            if current == name:
+                break
+            for upstream in sorted(graph[current]):
+                if upstream in component and upstream not in previous:
+                    previous[upstream] = current
+                    queue.append(upstream)
+
+        cycle = [name]
+        current = previous[name]
+        while current != name:
+            cycle.append(current)
+            current = previous[current]
+        cycle.append(name)
+        return list(reversed(cycle))
+
+    def find_resolved_spec(self, dependency):
+        """
+        find_all_dependencies() for resolving, a given dependency specification is looked up only once.
+        The "so" directory is part of the specification as it is where an external library is looked up.
+        """
+        so = dependency.original_dict.get('so') if dependency.original_dict else None
+        key = (dependency.to_string(), bool(self.conf.keep_track or dependency.keep_track),
+               so if isinstance(so, str) else None)
+        if key not in self.resolved_specs:
+            self.resolved_specs[key] = self.find_all_dependencies(dependency)
+        return self.resolved_specs[key]
+
+    def resolve_dependencies(self, package):
+        """
+        Replace the dependencies of 'package' with the best matching loaded packages, or a copy of the
+        dependency with a PACKAGE_NOT_FOUND error if there is no match. The loaded packages are shared
+        so the resolved packages form a DAG where each package is resolved exactly once. Packages with
+        circular dependencies are not resolved, see find_circular_dependencies().
+        """
+        inf_alt('resolving ' + str(package))
         indent()
 
         dependencies = package.get_dependencies()
-
         if dependencies:
             package.dependencies = []
-            level += 1
-
+            all_candidates = self.resolved_candidates.setdefault(id(package), [])
             for dependency in dependencies:
-                _, dependency_dependencies = self.find_all_dependencies(dependency)
-
-                if dependency_dependencies:
-                    for resolved in dependency_dependencies:
-                        deb(f'lookup gave "{str(resolved)}" for dependency {str(dependency)}')
-
-                        resolved.parent = package
-                        resolved = copy.copy(resolved)
-                        if level > 1:
-                            resolved.set_lookup()
-                        resolved_dependencies = resolved.get_dependencies()
-                        if resolved_dependencies:
-                            for d in resolved_dependencies:
-                                circular_dependency = d.search_upstream()
-
-                                if circular_dependency:
-                                    _error, loaded_package = self.find_first_package(d)
-
-                                    if loaded_package.get_errors():
-                                        continue
-                                    error = Error(ErrorCode.CIRCULAR_DEPENDENCY, d,
-                                                  d.to_string() + ' required by ' + resolved.to_extra_string())
-                                    if _error.is_ok():
-                                        loaded_package.add_error(error)
-                                    package.dependencies.append(resolved)
-                                    return False
-
-                        dep_success = self.resolve_dependencies(resolved, level)
-                        unindent()
-                        if not dep_success:
-                            return False
-
-                    selected_dependency = max(dependency_dependencies)
-                    package.dependencies.append(selected_dependency)
+                _, candidates = self.find_resolved_spec(dependency)
+
+                if candidates:
+                    all_candidates.extend(candidates)
+                    for candidate in candidates:
+                        deb(f'lookup gave "{str(candidate)}" for dependency {str(dependency)}')
+                        candidate.parent = package
+                    package.dependencies.append(max(candidates))
                 else:
                     resolved = copy.copy(dependency)
-                    if level > 1:
-                        resolved.set_lookup()
                     error = Error(ErrorCode.PACKAGE_NOT_FOUND, resolved,
                                   resolved.to_string() + ' required by ' + package.to_string())
                     resolved.add_error(error)
@@ -287,12 +555,31 @@ class Obsoleta:
                     package.dependencies.append(resolved)
                     if get_info_log_level():
                         war('package ' + dependency.to_string() + ' does not exist, required by ' + package.to_string())
-
-            level -= 1
         unindent()
-        return True
 
-    def aggregate_attributes(self, package, level=0):
+    def set_lookups(self):
+        """
+        The loaded packages are shared by all the trees they are part of and are left as direct
+        dependencies. The not found dependencies are specific to the package requiring them and are
+        marked as found through a lookup if that package is itself at least two levels down in a tree.
+        """
+        candidates = set()
+        for package_candidates in self.resolved_candidates.values():
+            candidates.update(id(candidate) for candidate in package_candidates)
+
+        lookups = set()
+        for package in self.loaded_packages:
+            if id(package) in candidates:
+                lookups.update(id(candidate) for candidate in self.resolved_candidates.get(id(package), []))
+
+        loaded = set(id(package) for package in self.loaded_packages)
+        for package in self.loaded_packages:
+            if id(package) in lookups:
+                for dependency in package.get_dependencies() or []:
+                    if id(dependency) not in loaded:
+                        dependency.direct_dependency = False
+
+    def aggregate_attributes(self, package):
         """
         Starting from the bottom of the dependency tree then add attributes from upstreams to their
         downstream parent packages in case any downstream attributes are undefined, and the upstream
@@ -301,41 +588,70 @@ class Obsoleta:
         didn't ask for an explicit arch. If the downstream asked for an explicit arch it would have
         failed while running 'resolve_dependencies'.
         This Aggregate attributes are stored in the 'implicit_attributes' dictionary in a given package.
+
+        Each package in the tree is aggregated once, bottom-up, and the outcome is kept in 'aggregated'
+        as either None or the (downstream, upstream, depth) of the first arch collision found below it.
+        The collision is reported as an error every time it is found below a package given here.
         """
-        dependencies = package.get_dependencies()
-        if dependencies:
-            indent()
+        upstream_lists = {}
 
-            for dependency in dependencies:
+        def upstreams(package):
+            if id(package) in self.aggregated or id(package) in self.circular:
+                return None
+            upstream_list = []
+            for dependency in package.get_dependencies() or []:
                 _errorcode, resolved_list = self.find_all_dependencies(dependency)
+                upstream_list.extend(resolved_list)
+            upstream_lists[id(package)] = upstream_list
+            return upstream_list
+
+        for step, downstream in Walk(package, upstreams, unique=True):
+            if step == ENTER or id(downstream) in self.aggregated:
+                continue
+            self.aggregated[id(downstream)] = self.aggregate_package(downstream, upstream_lists.get(id(downstream), []))
+
+        collision = self.aggregated[id(package)]
+        if not collision:
+            return True
+
+        downstream, resolved, depth = collision
+        error = Error(ErrorCode.ARCH_MISMATCH, resolved, 'arch collision with ' + downstream.to_string())
+        resolved.add_error(error)
+        try:
+            downstream.find_dependency(resolved, strict=True).add_error(error)
+        except:
+            pass
+        if self.args.verbose:
+            for _ in range(depth):
+                indent()
+            err(error.to_string())
+            for _ in range(depth):
+                unindent()
+        return False
+
+    def aggregate_package(self, package, upstream_list):
+        """
+        Aggregate the attributes of 'package' from its already aggregated 'upstream_list', see
+        aggregate_attributes(). Returns the first arch collision found at or below 'package' or None.
+        """
+        for resolved in upstream_list:
+            collision = self.aggregated.get(id(resolved))
+            if collision:
+                downstream, upstream, depth = collision
+                return downstream, upstream, depth + 1
 
-                for resolved in resolved_list:
-                    if not self.aggregate_attributes(resolved, level):
-                        return False
-
-                    # mixing different arch is downright illegal
-                    if self.conf.using_arch:
-                        resolved_arch = resolved.get_arch(implicit=True)
-                        package_arch = package.get_arch(implicit=True)
-
-                        if resolved_arch not in (anyarch, package_arch):
-                            if package_arch != anyarch:
-                                error = Error(
-                                    ErrorCode.ARCH_MISMATCH, resolved, 'arch collision with ' + package.to_string())
-                                resolved.add_error(error)
-                                try:
-                                    package.find_dependency(resolved, strict=True).add_error(error)
-                                except:
-                                    pass
-                                if self.args.verbose:
-                                    err(error.to_string())
-                                return False
-
-                            deb(f'setting implicit arch for {package.get_name()} to {resolved_arch}')
-                            package.set_implicit('arch', resolved.get_arch())
-            unindent()
+            # mixing different arch is downright illegal
+            if self.conf.using_arch:
+                resolved_arch = resolved.get_arch(implicit=True)
+                package_arch = package.get_arch(implicit=True)
 
-        return True
+                if resolved_arch not in (anyarch, package_arch):
+                    if package_arch != anyarch:
+                        return package, resolved, 1
+
+                    deb(f'setting implicit arch for {package.get_name()} to {resolved_arch}')
+                    package.set_implicit('arch', resolved.get_arch())
+        return None
 
     def locate_external_lib(self, target_package):
         try:
@@ -348,20 +664,48 @@ class Obsoleta:
             version = binary. replace(lib_name + '.', '')
             _ = Version(version)
             package = Package.construct_from_compact(self.conf, '%s:%s' % (name, version), so_path)
-            self.loaded_packages.append(package)
+            if not self.frozen:
+                self.add_loaded_package(package)
             return [package]
         except:
             return []
 
+    def add_loaded_package(self, package):
+        self.check_writable('add packages to')
+        self.loaded_packages.append(package)
+        self.packages_by_name.setdefault(package.get_name(), []).append(package)
+
+    def index_loaded_packages(self):
+        """
+        Rebuild the name index after the loaded package list has been reordered or replaced.
+        """
+        self.packages_by_name = {}
+        self.loaded_index = {}
+        for i, package in enumerate(self.loaded_packages):
+            self.packages_by_name.setdefault(package.get_name(), []).append(package)
+            self.loaded_index[id(package)] = i
+
+    def candidates(self, package):
+        """
+        Return the loaded packages that can possibly match 'package', which are the packages with
+        the same name, in the order of the loaded package list. The name '*' matches any name.
+        """
+        name = package.get_name()
+        if name == '*':
+            return self.loaded_packages
+        if '*' in self.packages_by_name:
+            return [_package for _package in self.loaded_packages if _package.get_name() in (name, '*')]
+        return self.packages_by_name.get(name, [])
+
     def find_all_dependencies(self, target_package):
         """
         Find dependencies, either as native obsoleta packages or external libraries.
         Prefer perfect hits but if none is found then look for 'equal or better' packages.
         """
-        candidates = target_package.find_equals_no_upgrade(self.loaded_packages)
+        candidates = target_package.find_equals_no_upgrade(self.candidates(target_package))
 
         if not candidates:
-            for package in self.loaded_packages:
+            for package in self.candidates(target_package):
                 if self.conf.keep_track or target_package.keep_track:
                     if package.package_is_equal_or_better(target_package):
                         candidates.append(package)
@@ -379,7 +723,7 @@ class Obsoleta:
                      'no upstreams matches %s' % target_package.to_string()), candidates
 
     def find_all_packages(self, package):
-        matches = package.find_equal_or_better_in_list(self.loaded_packages)
+        matches = package.find_equal_or_better_in_list(self.candidates(package))
 
         if not matches:
             return Error(ErrorCode.PACKAGE_NOT_FOUND, package), matches
@@ -425,13 +769,14 @@ class Obsoleta:
             archs.append(target.get_arch())
         return ErrorOk(), list(set(archs))
 
-    def locate_upstreams(self, target_package, updown_stream_filter, upstream_packages=None):
+    def locate_upstreams(self, target_package, updown_stream_filter, upstream_packages=None, followed=None):
         """"
         Find any upstream packages that the 'target_package' references.
         Param: 'updown_stream_filter' of type UpDownstreamFilter (specifying the depth)
         Returns: tuple(errorcode, [upstream packages])
         """
         if upstream_packages is None:
+            self.resolve_subgraph(target_package)
             upstream_packages = []
             error, package = self.find_first_package(target_package, strict=True)
             if not package:
@@ -443,13 +788,29 @@ class Obsoleta:
         if error.has_error():
             return error, target
 
+        # the dependencies of packages with circular dependencies are left unresolved
+        if updown_stream_filter == UpDownstreamFilter.FollowTree and id(target) in self.circular:
+            for error in target.get_errors() or ():
+                if error.get_errorcode() == ErrorCode.CIRCULAR_DEPENDENCY:
+                    return error, upstream_packages
+            error = Error(ErrorCode.CIRCULAR_DEPENDENCY, target, f'{target} has circular dependencies')
+            return error, upstream_packages
+
+        # the ids of the packages already followed, a package reached more than once is only followed once
+        if followed is None:
+            followed = set()
+        if id(target) in followed:
+            return ErrorOk(), upstream_packages
+        followed.add(id(target))
+
         dependencies = target.get_dependencies()
 
         for upstream in dependencies:
             if updown_stream_filter == UpDownstreamFilter.FollowTree:
                 error, candidates = self.locate_upstreams(upstream,
                                                           updown_stream_filter=updown_stream_filter,
-                                                          upstream_packages=upstream_packages)
+                                                          upstream_packages=upstream_packages,
+                                                          followed=followed)
                 if error.has_error():
                     return error, candidates
                 upstream_packages.append(upstream)
@@ -468,62 +829,82 @@ class Obsoleta:
             inf(f'no upstreams found for {target_package}')
         return ErrorOk(), upstreams
 
-    def locate_downstreams(self, target_package, updown_stream_filter, downstream_packages=None):
+    def locate_downstreams(self, target_package, updown_stream_filter):
         """
         Find any downstream packages that references the 'target_package' in their
         depends section.
         Param: 'updown_stream_filter' of type UpDownstreamFilter (specifying the depth)
         Returns: tuple(errorcode, [downstream packages])
         """
-        if downstream_packages is None:
-            downstream_packages = []
-            _error, package = self.find_first_package(target_package, strict=True)
-            if not package:
-                return Error(ErrorCode.PACKAGE_NOT_FOUND,
-                             target_package,
-                             f'{target_package} not found'), downstream_packages
-
-        for parent in self.loaded_packages:
-            package_deps = parent.get_dependencies()
-            if package_deps:
-                for package in package_deps:
-                    if package.package_is_equal_or_better(target_package, strict_track=False):
-                        if updown_stream_filter != UpDownstreamFilter.TreeOnly or not parent.parent:
-                            downstream_packages.append(parent)
-                        if updown_stream_filter in (UpDownstreamFilter.FollowTree, UpDownstreamFilter.TreeOnly):
-                            self.locate_downstreams(parent,
-                                                    updown_stream_filter=updown_stream_filter,
-                                                    downstream_packages=downstream_packages)
+        # any package might be a downstream
+        self.resolve_subgraph()
+        downstream_packages = []
+        _error, package = self.find_first_package(target_package, strict=True)
+        if not package:
+            return Error(ErrorCode.PACKAGE_NOT_FOUND,
+                         target_package,
+                         f'{target_package} not found'), downstream_packages
+
+        if self.downstream_index is None:
+            self.downstream_index = self.index_downstreams()
+
+        # breadth first from the target, each downstream is followed once
+        followed = set()
+        pending = collections.deque([target_package])
+        while pending:
+            target = pending.popleft()
+            for dependency, parent in self.downstream_candidates(target):
+                if dependency.package_is_equal_or_better(target, strict_track=False):
+                    if updown_stream_filter != UpDownstreamFilter.TreeOnly or not parent.parent:
+                        downstream_packages.append(parent)
+                    if (updown_stream_filter in (UpDownstreamFilter.FollowTree, UpDownstreamFilter.TreeOnly) and
+                            id(parent) not in followed):
+                        followed.add(id(parent))
+                        pending.append(parent)
 
         if not downstream_packages:
             inf(f'no downstreams found for {target_package}')
         return ErrorOk(), sorted(list(set(downstream_packages)))
 
-    def check_for_multiple_versions(self):
-        inf('checking for multiple versions in package tree')
-        indent()
+    def index_downstreams(self):
+        """
+        Return the reverse dependency index, name -> [(dependency, parent)], with an entry for each of the
+        resolved dependencies of each loaded package.
+        """
+        index = {}
+        for parent in self.loaded_packages:
+            for dependency in parent.get_dependencies() or []:
+                index.setdefault(dependency.get_name(), []).append((dependency, parent))
+        return index
 
-        for package in self.loaded_packages:
-            package_list = self.get_package_list(package)
-            unique_packages = set(package_list)
+    def downstream_candidates(self, package):
+        """
+        Return the (dependency, parent) pairs from the downstream index where the dependency can possibly
+        match 'package', which are the dependencies with the same name or the name '*'.
+        """
+        name = package.get_name()
+        if name == '*':
+            return [pair for pairs in self.downstream_index.values() for pair in pairs]
+        return self.downstream_index.get(name, []) + self.downstream_index.get('*', [])
 
-            names = self.get_duplicates_by_name(unique_packages)
+    def check_for_multiple_versions(self, packages):
+        inf('checking for multiple versions in package tree')
+        indent()
 
-            for name in names:
-                candidate = []
-                for _package in unique_packages:
-                    if _package.get_name() == name:
-                        candidate.append(_package)
+        multiple_versions = self.find_multiple_versions(packages)
 
+        for package in packages:
+            for candidate in multiple_versions.get(id(package), []):
                 for i in range(len(candidate)):
-                    for second_candidate in candidate[i + 1:]:
-                        if candidate[i].is_duplicate(second_candidate):
+                    first_candidate, first_parent = candidate[i]
+                    for second_candidate, second_parent in candidate[i + 1:]:
+                        if first_candidate.is_duplicate(second_candidate):
                             err1 = Error(ErrorCode.MULTIPLE_VERSIONS,
-                                         candidate[i],
-                                         f'with parent {candidate[i].parent}')
+                                         first_candidate,
+                                         f'with parent {first_parent}')
                             err2 = Error(ErrorCode.MULTIPLE_VERSIONS,
                                          second_candidate,
-                                         f'with parent {second_candidate.parent}')
+                                         f'with parent {second_parent}')
                             package.add_error(err1)
                             package.add_error(err2)
                             if self.args.verbose:
@@ -531,14 +912,68 @@ class Obsoleta:
                                 err('ERROR: ' + err2.to_string())
         unindent()
 
-    def get_package_list(self, package, packages=None):
-        if packages is None:
-            packages = []
-        packages.append(package)
-        if package.dependencies:
-            for dependency in package.dependencies:
-                packages.extend(self.get_package_list(dependency))
-        return packages
+    def find_multiple_versions(self, packages):
+        """
+        Return a dictionary with the id of each of the resolved 'packages' having different packages with the same
+        name in its tree mapped to a list with a list of these packages for each such name. The packages
+        are given as (package, parent) where the parent is the first package in the tree requiring it, or None
+        for the top package. A loaded package is shared by all the trees, so its own parent can't tell.
+        The names of the packages in each tree, name -> {package string: (package, parent)}, are collected
+        bottom-up once through the resolved graph. The names of a package are merged into those of
+        its downstreams and dropped once the last downstream has them.
+        """
+        downstreams = collections.Counter()
+        counted = set()
+
+        def count_downstreams(package):
+            if id(package) in counted:
+                return None
+            counted.add(id(package))
+            for dependency in package.get_dependencies() or []:
+                downstreams[id(dependency)] += 1
+            return package.get_dependencies()
+
+        for package in packages:
+            for _ in Walk(package, count_downstreams):
+                pass
+
+        names = {}
+        done = set()
+        multiple_versions = {}
+
+        def upstreams(package):
+            if id(package) in done:
+                return None
+            return package.get_dependencies()
+
+        for package in packages:
+            for step, resolved in Walk(package, upstreams, unique=True):
+                if step == ENTER or id(resolved) in done:
+                    continue
+                done.add(id(resolved))
+
+                resolved_names = {resolved.get_name(): {resolved.to_string(): (resolved, None)}}
+                for dependency in resolved.get_dependencies() or []:
+                    for name, packages in names[id(dependency)].items():
+                        merged = resolved_names.setdefault(name, {})
+                        for key, (_package, parent) in packages.items():
+                            merged.setdefault(key, (_package, resolved if _package is dependency else parent))
+                    downstreams[id(dependency)] -= 1
+                    if not downstreams[id(dependency)]:
+                        del names[id(dependency)]
+
+                if downstreams[id(resolved)]:
+                    names[id(resolved)] = resolved_names
+                duplicates = [list(packages.values()) for packages in resolved_names.values() if len(packages) > 1]
+                if duplicates:
+                    multiple_versions[id(resolved)] = duplicates
+        return multiple_versions
+
+    def get_package_list(self, package):
+        """
+        Return 'package' and the packages in its tree in depth first order, each package only once.
+        """
+        return [_package for _package, _ in preorder(package, lambda _package: _package.dependencies, unique=True)]
 
     def dump_tree(self, root_package):
         """
@@ -549,8 +984,9 @@ class Obsoleta:
         indention for dependencies matching their depth in the tree.
         """
         ret = []
+        self.resolve_subgraph(root_package)
 
-        matches = root_package.find_equal_or_better_in_list(self.loaded_packages)
+        matches = root_package.find_equal_or_better_in_list(self.candidates(root_package))
 
         if not matches:
             return Error(ErrorCode.PACKAGE_NOT_FOUND, root_package), ret
@@ -573,110 +1009,205 @@ class Obsoleta:
         Returns a tupple with two lists ([errors], [upstreams sorted in build order])
         The error list will be [ErrorOk] on success.
         """
+        errors, packages_build_order, _ = self.build_order(root_package)
+        return errors, packages_build_order
+
+    def dump_build_waves(self, root_package):
+        """
+        Returns a tupple with two lists ([errors], [build waves]) where each build wave is a list of the
+        packages that only depends on packages in the previous waves and which can be built concurrently.
+        The packages in a wave are in build order. The error list will be [ErrorOk] on success.
+        """
+        errors, packages_build_order, levels = self.build_order(root_package)
+        waves = []
+        for package, level in zip(packages_build_order, levels):
+            while len(waves) <= level:
+                waves.append([])
+            waves[level].append(package)
+        return errors, waves
+
+    def dump_build_plan(self, root_package, workers, timings=None):
+        """
+        Returns a tupple ([errors], BuildPlan) with a schedule for building the packages in the build order
+        on 'workers' workers. The expected build times are taken from 'timings', a dictionary from a timings
+        file, or the "build_cost" of the packages. See buildplan.py.
+        """
+        errors, packages_build_order, _ = self.build_order(root_package)
+        costs = [build_cost(package, timings) for package in packages_build_order]
+        return errors, make_build_plan(packages_build_order, workers, costs)
+
+    def build_order(self, root_package):
+        """
+        Topological sort (Kahn) of the packages in the tree of 'root_package'. Of the packages ready to be
+        built the one found first in the tree is always taken next.
+        Returns a tupple ([errors], [upstreams sorted in build order], [build wave of each upstream]).
+        """
         packages_build_order = []
+        levels = []
+        self.resolve_subgraph(root_package)
 
         error, match = self.find_first_package(root_package)
         if error.has_error():
-            return [error], []
+            return [error], [], []
 
         if match.get_errors():
-            return match.get_errors(), []
+            return match.get_errors(), [], []
 
         package_list = self.get_package_list(match)
 
         if package_list:
             package_list = list(dict.fromkeys(package_list))
-            deleted = []
-            found_next = True
-
-            while found_next:
-                found_next = False
-                for package in package_list.copy():
-                    upstreams = package.get_nof_dependencies()
-                    if not upstreams:
-                        packages_build_order.append(package)
-                        package_list.remove(package)
-                        deleted.append(package)
-                        found_next = True
-                        break
-
-                    for dp in package.get_dependencies():
-                        if dp in deleted:
-                            upstreams -= 1
-                    if not upstreams:
-                        packages_build_order.append(package)
-                        package_list.remove(package)
-                        deleted.append(package)
-                        found_next = True
-                        break
+            index = {package.to_string(): i for i, package in enumerate(package_list)}
+            upstreams = [0] * len(package_list)
+            downstreams = [[] for _ in package_list]
+            for i, package in enumerate(package_list):
+                for dependency in package.get_dependencies() or []:
+                    upstreams[i] += 1
+                    upstream = index.get(dependency.to_string())
+                    if upstream is not None:
+                        downstreams[upstream].append(i)
+
+            package_levels = [0] * len(package_list)
+            ready = [i for i, count in enumerate(upstreams) if not count]
+            heapq.heapify(ready)
+            while ready:
+                i = heapq.heappop(ready)
+                packages_build_order.append(package_list[i])
+                levels.append(package_levels[i])
+                for downstream in downstreams[i]:
+                    upstreams[downstream] -= 1
+                    package_levels[downstream] = max(package_levels[downstream], package_levels[i] + 1)
+                    if not upstreams[downstream]:
+                        heapq.heappush(ready, downstream)
 
             if not packages_build_order:
                 error = Error(ErrorCode.CIRCULAR_DEPENDENCY, root_package, 'can\'t resolve %s' % root_package)
-            if package_list:
+            if len(packages_build_order) < len(package_list):
                 return [Error(ErrorCode.RESOLVE_ERROR,
                              root_package,
-                             f'unable to fully resolve {root_package}')], packages_build_order
+                             f'unable to fully resolve {root_package}')], packages_build_order, levels
         else:
             error = Error(ErrorCode.RESOLVE_ERROR, root_package, '%s not found' % root_package)
 
         if not error:
             error = ErrorOk()
-        return [error], packages_build_order
+        return [error], packages_build_order, levels
 
     def get_errors(self, package, errors=None):
         if errors is None:
             errors = []
         anypackage = package.get_name() == '*'
+        self.resolve_subgraph(package)
 
         if (not self.loaded_packages or
-           (not anypackage and not package.find_equal_or_better_in_list(self.loaded_packages))):
+           (not anypackage and not package.find_equal_or_better_in_list(self.candidates(package)))):
             return Error(ErrorCode.PACKAGE_NOT_FOUND, package), errors
 
         if not package:
             for _package in self.loaded_packages:
-                _package.error_list_append(_package, errors)
+                errors.extend(self.error_summary(_package)[0])
             if errors:
                 return errors[0], list(set(errors))
             return ErrorOk(), errors
 
         if anypackage:
             for _package in self.loaded_packages:
-                _package.error_list_append(errors)
+                errors.extend(self.error_summary(_package)[0])
         else:
-            package = package.find_equal_or_better_in_list(self.loaded_packages)[0]
-            package.error_list_append(errors)
+            package = package.find_equal_or_better_in_list(self.candidates(package))[0]
+            errors.extend(self.error_summary(package)[0])
 
         if errors:
             errors = sorted(list(set(errors)))
             return Error(ErrorCode.RESOLVE_ERROR, package), errors
         return ErrorOk(), []
 
-    def get_error_count(self):
+    def get_error_count(self, packages=None):
         errors = 0
-        for loaded_package in self.loaded_packages:
-            errors += len(loaded_package.error_list_append([]))
+        for loaded_package in self.loaded_packages if packages is None else packages:
+            errors += self.error_summary(loaded_package)[1]
         return errors
 
+    def error_summary(self, package):
+        """
+        Return tuple([errors], count) for the errors of 'package' and of every package in its tree.
+        The list has each error object once while the count, as Package.error_list_append(), counts
+        the errors once for each path to them. The summaries are made bottom-up and kept in
+        'error_summaries' until the next resolve.
+        """
+        def dependencies(package):
+            if id(package) in self.error_summaries:
+                return None
+            return package.get_dependencies()
+
+        for step, _package in Walk(package, dependencies, unique=True):
+            if step == ENTER or id(_package) in self.error_summaries:
+                continue
+            own_errors = _package.get_errors() or []
+            errors = {id(error): error for error in own_errors}
+            count = len(own_errors)
+            for dependency in _package.get_dependencies() or []:
+                dependency_errors, dependency_count = self.error_summaries[id(dependency)]
+                count += dependency_count
+                for error in dependency_errors:
+                    errors.setdefault(id(error), error)
+            self.error_summaries[id(_package)] = list(errors.values()), count
+
+        return self.error_summaries[id(package)]
+
     def serialize(self):
+        self.resolve_subgraph()
         return [package.to_dict(True) for package in self.loaded_packages]
 
-    @staticmethod
-    def default_cache_filename():
-        return os.path.join(os.path.dirname(__file__), 'local/obsoleta.cache')
+    def construct_cache_dir(self):
+        """
+        Return the directory in conf.cache_dir with the cache files for the roots and configuration
+        of this run. It is named by a hash of the roots, the settings and the cache file formats so
+        runs with the same roots and configuration share the cache files and other runs don't touch
+        them, see cachefile.py.
+        """
+        settings = sorted((key, value) for key, value in vars(self.conf).items()
+                          if key not in self.cache_ignored_settings)
+        formats = (PackageCache.version, GraphCache.version, Manifest.version)
+        return cache_namespace(self.conf.cache_dir, repr((self.roots, settings, formats)))
 
-    def write_cache(self):
-        try:
-            os.mkdir(os.path.join(os.path.dirname(__file__), 'local'))
-        except FileExistsError:
-            pass
-        packages = self.serialize()
-        with open(self.default_cache_filename(), 'w') as f:
-            f.write(json.dumps(packages, indent=4))
+    def cache_filename(self, name):
+        return os.path.join(self.cache_dir, name)
 
-    def load_cache(self):
-        with open(self.default_cache_filename()) as f:
-            cache = json.loads(f.read())
-        self.loaded_packages = [Package.construct_from_dict(self.conf, p) for p in cache]
+    def load_graph(self, graph):
+        """
+        Take the resolved packages from the GraphCache 'graph' if it is valid for the package files found.
+        Returns True if the packages were loaded.
+        """
+        loaded = graph.load(self.package_files)
+        if not loaded:
+            return False
+        packages, circular = loaded
+        deb(f'loaded {len(packages)} resolved packages from {graph.filename}')
+        self.loaded_packages = packages
+        self.index_loaded_packages()
+        self.circular = set(id(packages[i]) for i in circular)
+        self.resolved_specs = {}
+        self.resolved_candidates = {}
+        self.aggregated = {}
+        self.unresolved_names = set()
+        self.downstream_index = None
+        self.error_summaries = {}
+        return True
+
+    def read_cached_package_files(self, cache, package_files):
+        """
+        Return a dictionary file -> parsed json for the 'package_files' read through the PackageCache
+        'cache'. Files that can't be read are left out and are reported when they are loaded.
+        """
+        dictionaries = {}
+        for file in package_files:
+            try:
+                dictionaries[file] = cache.read(file)
+            except (OSError, BadPackageFile):
+                pass
+        inf(f'cache reused {cache.reused} package files, {cache.parsed} were parsed')
+        return dictionaries
 
     def generate_digraph(self, target_package):
         header = '"%s"[label=<<font face="DejaVuSans" point-size="14">'\
@@ -687,6 +1218,7 @@ class Obsoleta:
         dependency = '<tr><td><font color="orange">%s=%s</font></td></tr>\n'
         footer = '</table></font>>];\n'
 
+        self.resolve_subgraph(target_package)
         _, packages = self.find_all_dependencies(target_package)
         for package in packages:
             dest_file = package.to_compact_string('_', True) + '.gv'
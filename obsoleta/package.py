@@ -5,6 +5,7 @@ from .log import deb, inf, war, indent, unindent, get_indent
 from .version import Version, VersionAny
 from .common import Error, get_package_filepath, get_key_filepath, printing_path
 from .errorcodes import ErrorCode
+from .traversal import preorder
 from .exceptions import BadPackageFile, MissingKeyFile, InvalidKeyFile
 from .exceptions import CompactParseError, UnknownException, IllegalDependency
 
@@ -42,6 +43,19 @@ class Layout(Enum):
 
 class Package:
     def __init__(self, conf, package_path, compact, dictionary, key=None, keypath=None):
+        self.set_defaults(conf, package_path)
+
+        if keypath:
+            key = Package.load_key(keypath)
+
+        if compact:
+            self.from_compact(compact, package_path)
+        elif package_path:
+            self.from_package_path(package_path, key=key, dictionary=dictionary)
+        else:
+            self.from_dict(dictionary)
+
+    def set_defaults(self, conf, package_path):
         self.conf = conf
         self.parent = None
         self.package_path = package_path
@@ -58,16 +72,6 @@ class Package:
         self.keep_track = False
         self.package_section = None
 
-        if keypath:
-            key = Package.load_key(keypath)
-
-        if compact:
-            self.from_compact(compact, package_path)
-        elif package_path:
-            self.from_package_path(package_path, key=key, dictionary=dictionary)
-        else:
-            self.from_dict(dictionary)
-
     @classmethod
     def construct_from_dict(cls, conf, dictionary):
         return cls(conf, None, None, dictionary)
@@ -84,6 +88,17 @@ class Package:
     def construct_from_compact(cls, conf, compact, package_path=None):
         return cls(conf, package_path, compact, None)
 
+    @classmethod
+    def construct_from_cache(cls, conf, attributes):
+        """ Returns a package restored from a graph cache, see loader.GraphCache. It gets the defaults
+            of any other package before the recorded 'attributes' are set, the references to other
+            packages are set by the cache once they are all constructed. """
+        package = cls.__new__(cls)
+        package.set_defaults(conf, None)
+        for attribute, value in attributes.items():
+            setattr(package, attribute, value)
+        return package
+
     @classmethod
     def auto_package(self, conf, package_or_compact):
         """
@@ -722,9 +737,9 @@ class Package:
         With skip_dependencies equal True dump() will return any errors and the output of to_string() for
         the package itself (but still wrapped in lists).
 
-        With skip_dependencies equal False, dump() will additionally recurse through all dependencies with
+        With skip_dependencies equal False, dump() will additionally walk through all dependencies with
         indentations in the compact representations for visually presenting the package and its dependencies
-        in tree style.
+        in tree style. The walk doesn't continue below a dependency with errors.
         """
         if ret is None:
             ret = []
@@ -732,18 +747,23 @@ class Package:
         if errors is None:
             errors = []
 
-        title = get_indent() + self.to_string()
-        ret.append(title)
+        ret.append(get_indent() + self.to_string())
 
         if self.errors:
             return self.errors, ret
 
-        if not skip_dependencies and self.dependencies:
-            indent()
-            for dependency in self.dependencies:
-                _errors, _ = dependency.dump(ret)
-                errors.extend(_errors)
-            unindent()
+        if not skip_dependencies:
+            def dependencies(package):
+                if package is self or not package.errors:
+                    return package.dependencies
+                return None
+
+            walk = preorder(self, dependencies)
+            next(walk)
+            for package, depth in walk:
+                ret.append(get_indent() + '  ' * depth + package.to_string())
+                if package.errors:
+                    errors.extend(package.errors)
         return list(set(errors)), ret
 
     def get_dependencies(self):
@@ -775,11 +795,12 @@ class Package:
         return self.errors
 
     def error_list_append(self, error_list):
-        if self.errors:
-            error_list.extend(self.errors)
-        if self.dependencies:
-            for dependency in self.dependencies:
-                dependency.error_list_append(error_list)
+        """
+        Append the errors of the package and of every package in its tree, once for each path to them.
+        """
+        for package, _ in preorder(self, lambda package: package.dependencies):
+            if package.errors:
+                error_list.extend(package.errors)
         return error_list
 
     def add_error(self, error):
@@ -793,18 +814,5 @@ class Package:
             for dependency in self.dependencies:
                 dependency.direct_dependency = False
 
-    def search_upstream(self, package_under_test=None, found=False):
-        if not package_under_test:
-            package_under_test = self
-        else:
-            deb(f'checking if upstream {str(self)} is the same as {package_under_test.to_string()}')
-
-        if self.parent:
-            if self.parent.get_name() == package_under_test.get_name():
-                log.info('circular dependency found for package ' + package_under_test.to_string())
-                return True
-            found = self.parent.search_upstream(package_under_test)
-        return found
-
     def get_layout(self):
         return Layout(self.layout).name
@@ -0,0 +1,61 @@
+import re, fnmatch
+
+
+class PathFilter:
+    """
+    The blacklist rules for the root scan compiled once so a path is tested against all of
+    them with a single regular expression search regardless of the number of rules.
+
+    'substrings' are the classic blacklist_paths where a path is blacklisted if any of them is
+    found anywhere in the path. They are compiled into one alternation of the escaped substrings,
+    so the text matched is the rule itself.
+    'globs' are fnmatch style patterns that must match the full path, e.g. '*/build_*'. They are
+    compiled into a single regular expression as well.
+
+    The number of directories pruned by each rule is counted in 'pruned'.
+    """
+    def __init__(self, substrings=(), globs=()):
+        self.substrings = list(dict.fromkeys(substrings))
+        self.globs = list(dict.fromkeys(globs))
+        self.pruned = {rule: 0 for rule in self.substrings + self.globs}
+
+        self.substring_regex = None
+        if self.substrings:
+            self.substring_regex = re.compile('|'.join(map(re.escape, self.substrings)))
+
+        self.glob_regex = None
+        if self.globs:
+            self.glob_regex = re.compile('|'.join(
+                '(?P<rule%i>%s)' % (index, fnmatch.translate(glob)) for index, glob in enumerate(self.globs)))
+
+    @classmethod
+    def from_conf(cls, conf):
+        return cls(conf.blacklist_paths, conf.blacklist_globs)
+
+    def match(self, path):
+        """
+        Return the first rule found matching 'path' or None if the path is not blacklisted.
+        """
+        if self.substring_regex:
+            match = self.substring_regex.search(path)
+            if match:
+                return match.group()
+
+        if self.glob_regex:
+            match = self.glob_regex.match(path)
+            if match:
+                return self.globs[int(match.lastgroup[4:])]
+        return None
+
+    def prune(self, path):
+        """
+        As match() but counts the directory as pruned by the matching rule.
+        """
+        rule = self.match(path)
+        if rule is None:
+            return None
+        self.pruned[rule] += 1
+        return rule
+
+    def pruned_summary(self):
+        return [(rule, count) for rule, count in self.pruned.items() if count]
@@ -0,0 +1,214 @@
+import os, json, queue, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .log import deb
+from .common import printing_path
+from .pathfilter import PathFilter
+from .cachefile import JsonCacheFile
+from .exceptions import BadPath
+
+
+class Listing:
+    """
+    The parts of a single directory listing that the package file search cares about. The
+    entries are (name, is_dir) tuples kept in the order given by os.scandir.
+    """
+    def __init__(self, path, skip, entries):
+        self.path = path
+        self.skip = skip
+        self.entries = entries
+
+
+def list_directory(path):
+    try:
+        scan_list = list(os.scandir(path))
+    except FileNotFoundError:
+        raise BadPath('bad path %s' % path)
+
+    for entry in scan_list:
+        if entry.name == 'obsoleta.skip':
+            return Listing(path, True, [])
+
+    return Listing(path, False, [(entry.name, entry.is_dir()) for entry in scan_list])
+
+
+class Manifest(JsonCacheFile):
+    """
+    A persisted copy of the directory listings from the previous scan. A directory is only
+    listed again if its mtime has changed since it was recorded, for all other directories
+    the recorded subdirectories and package/key files are reused.
+    Only the directories visited in the current scan are written back by save().
+    """
+    entries = 'directories'
+    # files, besides directories, that are worth remembering from a listing
+    remembered_files = ('obsoleta.json', 'obsoleta.key')
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.reused = 0
+        self.rescanned = 0
+        self.lock = threading.Lock()
+        self.directories = self.load()
+
+    def listing(self, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            raise BadPath('bad path %s' % path)
+
+        recorded = self.directories.get(path)
+        if recorded and recorded['mtime'] == mtime:
+            with self.lock:
+                self.reused += 1
+                self.visited[path] = recorded
+            return Listing(path, recorded['skip'], [tuple(entry) for entry in recorded['entries']])
+
+        listing = list_directory(path)
+        entries = [(name, is_dir) for name, is_dir in listing.entries
+                   if is_dir or name in self.remembered_files]
+        with self.lock:
+            self.rescanned += 1
+            if self.recordable(mtime):
+                self.visited[path] = {'mtime': mtime, 'skip': listing.skip, 'entries': entries}
+        return listing
+
+
+class Scanner:
+    """
+    Makes the same recursive search as find_in_path() but the directory listings, which are
+    what takes the time on e.g. network filesystems, are spread over a pool of 'jobs' threads.
+    The listings are collected first and the result list is then assembled in the exact order
+    find_in_path() would have produced it.
+    If a Manifest is given then listings of unchanged directories are taken from it. Alternatively
+    'listing' is a function path -> Listing used instead of listing the directories.
+    If given then 'found' is called with each located file as soon as its directory has been
+    listed, i.e. in no particular order and before scan() returns.
+    Directories in 'merged_roots' are searched with the full conf.depth like find_in_path() does.
+    """
+    def __init__(self, conf, filename='obsoleta.json', jobs=None, manifest=None, path_filter=None, found=None,
+                 merged_roots=None, listing=None):
+        self.conf = conf
+        self.filename = filename
+        self.found = found
+        self.merged_roots = merged_roots if merged_roots else {}
+        self.jobs = jobs if jobs else conf.jobs
+        if manifest:
+            listing = manifest.listing
+        self.list_directory = listing if listing else list_directory
+        self.path_filter = path_filter if path_filter else PathFilter.from_conf(conf)
+        self.dirs_checked = 0
+        self.listings = {}
+
+    def subdirectories(self, listing):
+        for name, is_dir in listing.entries:
+            if is_dir:
+                path = os.path.join(listing.path, name)
+                if self.path_filter.match(path) is None:
+                    yield path
+
+    def subdirectory_depth(self, path, depth):
+        if path in self.merged_roots:
+            return self.conf.depth
+        return depth - 1
+
+    def collect_listings(self, roots):
+        """
+        Return a dictionary path -> Listing for every directory that the search will visit.
+        Each combination of directory and remaining depth is only listed once.
+        """
+        listings = {}
+        visited = set()
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            def submit(path, depth):
+                if (path, depth) in visited:
+                    return
+                visited.add((path, depth))
+                futures[pool.submit(self.list_directory, path)] = (path, depth)
+
+            for root in roots:
+                submit(root, self.conf.depth)
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, depth = futures.pop(future)
+                    listing = future.result()
+                    listings[path] = listing
+                    if self.found and not listing.skip:
+                        for name, is_dir in listing.entries:
+                            if name == self.filename and not is_dir:
+                                self.found(os.path.join(path, name))
+                    if depth and not listing.skip:
+                        for subdirectory in self.subdirectories(listing):
+                            submit(subdirectory, self.subdirectory_depth(subdirectory, depth))
+
+        self.dirs_checked = len(listings)
+        return listings
+
+    def assemble(self, listings, path, depth, results):
+        listing = listings[path]
+        if listing.skip:
+            deb('- skip file found, ignoring %s recursively' % path)
+            return
+
+        for name, is_dir in listing.entries:
+            entry_path = os.path.join(path, name)
+            if is_dir:
+                rule = self.path_filter.prune(entry_path)
+                if rule is not None:
+                    deb('- blacklisted by "%s", ignoring %s recursively' % (rule, entry_path))
+                    continue
+                if depth:
+                    self.assemble(listings, entry_path, self.subdirectory_depth(entry_path, depth), results)
+
+            if name == self.filename:
+                results.append(entry_path)
+                deb('located %s' % printing_path(entry_path, self.conf))
+
+    def scan(self, roots):
+        self.listings = self.collect_listings(roots)
+        results = []
+        for root in roots:
+            self.assemble(self.listings, root, self.conf.depth, results)
+        return results
+
+
+class ParsePipeline:
+    """
+    Reads and parses package files on 'jobs' worker threads while the scan is still running,
+    so the disk latency of the parsing overlaps the disk latency of the directory walk. Files
+    are fed with put() which blocks when 'queue_size' files are waiting, and close() returns
+    a dictionary path -> parsed json. Files that can't be read or parsed are left out, the
+    load will then fail on them in its usual deterministic order.
+    """
+    def __init__(self, jobs, queue_size=64):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dictionaries = {}
+        self.submitted = set()
+        self.workers = [threading.Thread(target=self.work, daemon=True) for _ in range(max(jobs, 1))]
+        for worker in self.workers:
+            worker.start()
+
+    def work(self):
+        while True:
+            file = self.queue.get()
+            if file is None:
+                return
+            try:
+                with open(file) as f:
+                    self.dictionaries[file] = json.loads(f.read())
+            except Exception:
+                pass
+
+    def put(self, file):
+        if file not in self.submitted:
+            self.submitted.add(file)
+            self.queue.put(file)
+
+    def close(self):
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        return self.dictionaries
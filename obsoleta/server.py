@@ -0,0 +1,264 @@
+import os, io, json, stat, time, socket, socketserver, threading, contextlib
+from .log import logger, handler, deb, inf, war, err
+from .scanner import Scanner, list_directory
+from .errorcodes import ErrorCode
+from .exceptions import ObsoletaException, ServerError
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+# seconds between polls of the roots when inotify is unavailable. With inotify this is just
+# a safety net for changes inotify can't see (e.g. on network filesystems).
+POLL_INTERVAL = 2
+INOTIFY_POLL_INTERVAL = 60
+
+watched_files = ('obsoleta.json', 'obsoleta.key')
+
+
+class PackageFileWatcher(threading.Thread):
+    """
+    Keeps track of the package and key files below the roots of an ObsoletaApi and asks the
+    server to reload whenever any of them are changed, added or removed. If the optional module
+    inotify_simple is available the scanned directories are watched with inotify and only the
+    directories with events are listed again, the listings of the others are reused. Otherwise,
+    and every INOTIFY_POLL_INTERVAL seconds as a safety net, all the roots are rescanned.
+    """
+    def __init__(self, server):
+        super().__init__(daemon=True)
+        self.server = server
+        self.files = {}
+        self.listings = {}
+        self.watches = {}
+        self.watched = {}
+        self.changed = None
+        self.inotify = None
+        if inotify_simple:
+            self.inotify = inotify_simple.INotify()
+            self.interval = INOTIFY_POLL_INTERVAL
+            flags = inotify_simple.flags
+            self.watch_flags = (flags.CREATE | flags.DELETE | flags.MODIFY | flags.CLOSE_WRITE |
+                                flags.MOVED_FROM | flags.MOVED_TO | flags.DELETE_SELF)
+        else:
+            self.interval = POLL_INTERVAL
+            inf('inotify_simple not available, polling for changes')
+
+    def listing(self, path):
+        """
+        The Scanner listing, which reuses the previous listing of 'path' unless inotify saw it change.
+        """
+        if self.changed is None or path in self.changed or path not in self.listings:
+            return list_directory(path)
+        return self.listings[path]
+
+    def snapshot(self):
+        """
+        Return the package files in scan order and a dictionary with (mtime, size) for all
+        package and key files found in the directories visited by the scan.
+        """
+        obsoleta = self.server.obsoleta.obsoleta
+        scanner = Scanner(obsoleta.conf, merged_roots=obsoleta.merged_roots, listing=self.listing)
+        package_files = scanner.scan(obsoleta.roots)
+        files = {}
+        for path, listing in scanner.listings.items():
+            reused = listing is self.listings.get(path)
+            for name, is_dir in listing.entries:
+                if not is_dir and name in watched_files:
+                    file = os.path.join(path, name)
+                    if reused and file in self.files:
+                        files[file] = self.files[file]
+                        continue
+                    try:
+                        stat = os.stat(file)
+                        files[file] = (stat.st_mtime_ns, stat.st_size)
+                    except FileNotFoundError:
+                        pass
+        self.listings = scanner.listings
+        self.update_watches(scanner.listings)
+        return package_files, files
+
+    def update_watches(self, listings):
+        if not self.inotify:
+            return
+        for path in set(self.watches) - set(listings):
+            watch = self.watches.pop(path)
+            self.watched.pop(watch, None)
+            try:
+                self.inotify.rm_watch(watch)
+            except OSError:
+                pass
+        for path in set(listings) - set(self.watches):
+            try:
+                watch = self.inotify.add_watch(path, self.watch_flags)
+                self.watches[path] = watch
+                self.watched[watch] = path
+            except OSError as e:
+                war(f'unable to watch {path}: {str(e)}')
+
+    def wait(self):
+        """
+        Wait for changes and set 'changed' to the directories inotify saw change, or to None if
+        all directories should be listed again.
+        """
+        self.changed = None
+        if not self.inotify:
+            time.sleep(self.interval)
+            return
+        events = self.inotify.read(timeout=self.interval * 1000)
+        if not events:
+            return
+        changed = set()
+        while events:
+            for event in events:
+                if event.mask & inotify_simple.flags.Q_OVERFLOW:
+                    # events were lost
+                    return
+                if event.wd in self.watched:
+                    changed.add(self.watched[event.wd])
+            # let a burst of changes, e.g. a checkout, settle before reloading
+            events = self.inotify.read(timeout=100)
+        deb(f'inotify reported changes in {len(changed)} directories')
+        self.changed = changed
+
+    def prime(self):
+        _package_files, self.files = self.snapshot()
+    def refresh(self):
+        package_files, files = self.snapshot()
+        changed = [file for file in set(files) | set(self.files) if files.get(file) != self.files.get(file)]
+        self.files = files
+        if changed:
+            inf(f'{len(changed)} package/key files changed, reloading')
+            for file in sorted(changed):
+                deb(f'  {file}')
+            self.server.reload(package_files, changed)
+
+    def run(self):
+        while True:
+            self.wait()
+            with self.server.lock:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    err(f'refresh failed: {str(e)}')
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            output, exit_code = self.server.query(request['argv'], request['cwd'])
+        except Exception as e:
+            output, exit_code = f'server failed to process request: {str(e)}\n', ErrorCode.UNKNOWN_EXCEPTION.value
+        self.wfile.write(json.dumps({'output': output, 'exit_code': exit_code}).encode() + b'\n')
+
+
+class ObsoletaServer(socketserver.UnixStreamServer):
+    """
+    Holds a loaded and resolved ObsoletaApi and answers queries from 'obsoleta.py --connect'
+    clients on a unix domain socket. A query is the command line of the client which is executed
+    by 'execute' on the warm model, with the output that would have been printed and the
+    exit code sent back to the client. Queries and reloads are serialized.
+    """
+    def __init__(self, socket_path, construct, execute):
+        """
+        Param: 'construct' returns a new ObsoletaApi.
+        Param: 'execute' takes (ObsoletaApi or None, argv, exception or None) and returns
+               the exit code as an ErrorCode.
+        """
+        self.socket_path = socket_path
+        self.execute = execute
+        self.lock = threading.Lock()
+        self.exception = None
+        remove_stale_socket(socket_path)
+        self.obsoleta = construct()
+        super().__init__(socket_path, RequestHandler)
+        self.watcher = PackageFileWatcher(self)
+
+    def reload(self, package_files, changed_files):
+        try:
+            self.obsoleta.reload(package_files, changed_files)
+            self.exception = None
+        except ObsoletaException as e:
+            err(f'reload failed with {e.ErrorCode.name}: {str(e)}')
+            self.exception = e
+
+    def query(self, argv, cwd):
+        """
+        Execute the client command line 'argv' from the client working directory 'cwd' and
+        return the tuple (output, exit code).
+        """
+        with self.lock:
+            level = logger.level
+            stream = handler.stream
+            server_cwd = os.getcwd()
+            output = io.StringIO()
+            handler.setStream(output)
+            try:
+                os.chdir(cwd)
+                with contextlib.redirect_stdout(output):
+                    exit_code = self.execute(self.obsoleta, argv, self.exception)
+            finally:
+                os.chdir(server_cwd)
+                handler.setStream(stream)
+                logger.setLevel(level)
+            return output.getvalue(), exit_code.value
+
+    def serve(self):
+        inf(f'serving on {self.socket_path}')
+        with self.lock:
+            self.watcher.prime()
+        self.watcher.start()
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server_close()
+            os.remove(self.socket_path)
+
+
+def remove_stale_socket(socket_path):
+    """
+    Remove the socket left behind by a server that is no longer running. Raises ServerError if
+    'socket_path' is not a socket or if a server is still listening on it.
+    """
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ServerError(f'{socket_path} exists and is not a socket')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            deb(f'removing stale socket {socket_path}')
+            os.remove(socket_path)
+            return
+        except OSError as e:
+            raise ServerError(f'unable to check socket {socket_path}: {str(e)}')
+    raise ServerError(f'a server is already listening on {socket_path}')
+
+
+def query_server(socket_path, argv):
+    """
+    Send the command line 'argv' to a server started with --serve and return the tuple
+    (output, exit code) it answered with. Raises ServerError if the server can't be reached.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(socket_path)
+            connection.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd()}).encode() + b'\n')
+            response = b''
+            while True:
+                data = connection.recv(65536)
+                if not data:
+                    break
+                response += data
+        response = json.loads(response)
+        return response['output'], response['exit_code']
+    except OSError as e:
+        raise ServerError(f'unable to query server on {socket_path}: {str(e)}')
+    except (ValueError, KeyError):
+        raise ServerError(f'invalid answer from server on {socket_path}')
@@ -7,6 +7,7 @@ from obsoleta.obsoletacore import UpDownstreamFilter
 from obsoleta.errorcodes import ErrorCode
 from obsoleta.version import Version
 from obsoleta.package import Package
+from obsoleta.buildplan import build_cost, default_build_cost
 
 args = Args()
 args.set_depth(2)
@@ -74,6 +75,37 @@ title('TOA 3D', 'buildorder')
 errors, messages = obsoleta.buildorder('a', True)
 test_ok(errors[0])
 
+title('TOA 3E', 'buildwaves, the build order split in waves that can be built concurrently')
+errors, waves = obsoleta.buildwaves('a')
+test_ok(errors[0])
+test_eq(str(waves),
+        '[[b:2.2.2:anytrack:anyarch:unknown, c:3.3.3:anytrack:anyarch:unknown, '
+        'd:4.4.4:anytrack:linux:unknown, f:6.6.6:anytrack:linux:unknown], '
+        '[e:5.5.5:anytrack:linux:unknown], [a:1.1.1:anytrack:linux:unknown]]')
+test_eq([package for wave in waves for package in wave], obsoleta.buildorder('a')[1])
+
+title('TOA 3F', 'buildplan, the build order scheduled on 2 workers')
+errors, plan = obsoleta.buildplan('a', 2)
+test_ok(errors[0])
+test_eq(str([step.package for step in plan.steps]),
+        '[f:6.6.6:anytrack:linux:unknown, b:2.2.2:anytrack:anyarch:unknown, c:3.3.3:anytrack:anyarch:unknown, '
+        'd:4.4.4:anytrack:linux:unknown, e:5.5.5:anytrack:linux:unknown, a:1.1.1:anytrack:linux:unknown]')
+test_eq(plan.total_time, 4.0)
+test_eq(plan.critical_path_time, 3.0)
+test_eq(str(plan.critical_path), '[f:6.6.6:anytrack:linux:unknown, e:5.5.5:anytrack:linux:unknown, '
+                                 'a:1.1.1:anytrack:linux:unknown]')
+
+errors, plan = obsoleta.buildplan('a', 2, {'e': 5})
+test_ok(errors[0])
+test_eq(plan.total_time, 7.0)
+
+errors, plan = obsoleta.buildplan('a', 0)
+test_eq((errors[0].get_errorcode(), plan), (ErrorCode.MISSING_INPUT, None))
+
+# an invalid build_cost in a package file is ignored
+test_eq([build_cost(Package.construct_from_dict(conf, {'name': 'x', 'version': '1.0.0', 'build_cost': cost}))
+         for cost in (2.5, 0, -3, float('nan'), float('inf'), '3', True)], [2.5, 0.0] + [default_build_cost] * 5)
+
 # find upstream packages, i.e packages that the package argument depend on
 
 title('TOA 4A', 'upstream - a has 4 directly listed upstreams')
@@ -420,3 +452,17 @@ errors, messages = obsoleta.buildorder('a')
 test_ok(errors[0])
 test_eq(str(messages),'[c:1.2.3:production:anyarch:unknown, c:1.2.4:production:anyarch:unknown, \
 d:1.2.3:production:anyarch:unknown, b:0.1.0:testing:anyarch:unknown, a:0.1.2:development:anyarch:unknown]')
+
+
+title('TOA 12', 'run_batch gives a result for each query with its own errorcode')
+populate_local_temp('A2_test_simple')
+obsoleta = ObsoletaApi(conf, args)
+results = list(obsoleta.run_batch([{'command': 'upstream', 'package': 'b'},
+                                   {'command': 'check', 'package': 'oups'},
+                                   {'command': 'buildwaves', 'package': 'a', 'options': {'printpaths': True}},
+                                   {'command': 'bump', 'package': 'a'}]))
+test_eq([result['errorcode'] for result in results],
+        [ErrorCode.OK.value, ErrorCode.PACKAGE_NOT_FOUND.value, ErrorCode.OK.value, ErrorCode.MISSING_INPUT.value])
+test_eq([os.path.basename(path) for path in results[0]['result']], ['c', 'd', 'e'])
+test_eq([[os.path.basename(path) for path in wave] for wave in results[2]['result']], [['e', 'd'], ['c'], ['b'], ['a']])
+
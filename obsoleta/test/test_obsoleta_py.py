@@ -8,7 +8,7 @@ In case a test fails then the program exits immediately.
 Tests that need to modify the testdata should use populate_local_temp() to get a temporary copy to work on.
 """
 # flake8: noqa E502
-import os, time
+import os, time, json, shutil
 from obsoleta.errorcodes import ErrorCode
 from obsoleta.test.test_common import TESTDATA_PATH, execute, test_eq, title, populate_local_temp
 
@@ -78,6 +78,36 @@ test_eq(output[2].endswith('d'))
 test_eq(output[3].endswith('b'))
 test_eq(output[4].endswith('a'))
 
+title('A5b', 'simple sunshine --buildwaves')
+exitcode, output = run_std('A2_test_simple', '--package a --buildwaves', ErrorCode.OK)
+test_eq("""e:1.2.3:anytrack:linux_x86_64:unknown d:0.1.2:anytrack:linux_x86_64:release
+c:2.1.2:anytrack:anyarch:unknown
+b:1.1.2:anytrack:linux_x86_64:unknown
+a:0.1.2:anytrack:anyarch:unknown""" in output)
+
+title('A5c', 'simple sunshine --buildplan on 2 workers')
+exitcode, output = run_std('A2_test_simple', '--package a --buildplan 2', ErrorCode.OK)
+test_eq("""0 1 1 e:1.2.3:anytrack:linux_x86_64:unknown
+0 1 2 d:0.1.2:anytrack:linux_x86_64:release
+1 2 1 c:2.1.2:anytrack:anyarch:unknown""" in output)
+test_eq('total time 4' in output)
+
+title('A5d', '--buildplan with no workers or with an invalid timings file fails with a clear error')
+exitcode, output = run_std('A2_test_simple', '--package a --buildplan 0', ErrorCode.MISSING_INPUT)
+test_eq('--buildplan needs at least 1 worker' in output)
+os.makedirs('local', exist_ok=True)
+with open('local/timings.json', 'w') as f:
+    f.write('{"e": 2, "c": "slow"}')
+exitcode, output = run_std('A2_test_simple', '--package a --buildplan 2 --timings local/timings.json',
+                           ErrorCode.BAD_PATH)
+test_eq('timings file local/timings.json has an invalid build time for "c": "slow"' in output)
+with open('local/timings.json', 'w') as f:
+    f.write('{"e": NaN}')
+exitcode, output = run_std('A2_test_simple', '--package a --buildplan 2 --timings local/timings.json',
+                           ErrorCode.BAD_PATH)
+test_eq('timings file local/timings.json has an invalid build time for "e": NaN' in output)
+os.remove('local/timings.json')
+
 title('A6', 'simple sunshine --upstream')
 exitcode, output = run_std('A2_test_simple', '--package a --upstream', ErrorCode.OK)
 test_eq(output is not None)
@@ -179,6 +209,10 @@ exitcode, output = run_std('C5_test_multiple_versions', '--package d --check', E
 title('C7', 'fail to list buildorder as there are a circular dependency, a <<< b <<< c <<< a')
 exitcode, output = run_std('C7_test_circular_dependency', '--package a --buildorder', ErrorCode.CIRCULAR_DEPENDENCY)
 
+title('C7b', 'the upstreams of a package in a circular dependency, a <<< b <<< c <<< a, can\'t be listed')
+exitcode, output = run_std('C7_test_circular_dependency', '--package b --upstream', ErrorCode.CIRCULAR_DEPENDENCY)
+test_eq('unable to locate upstream b:*:anytrack:anyarch:unknown, circular dependency b -> c -> a -> b' in output)
+
 title('C8', 'named architecture -> named architecture -> "anyarch" is ok')
 exitcode, output = run_std('C8_test_arch_noarch', '--package a:*:anytrack:beos --check', ErrorCode.OK)
 
@@ -347,6 +381,64 @@ test_eq('bumping package "b" (b:2.1.2:development:x86:unknown) from 2.1.2 to 7.9
 title('K1', 'simple sunshine with external lib dependency --check')
 exitcode, output = run_std('K1_system_lib_dependency', '--package k1 --check', ErrorCode.OK)
 
+title('L1', 'batch queries give a json line result for each query with its own errorcode')
+os.makedirs('local', exist_ok=True)
+with open('local/batch.jsonl', 'w') as f:
+    f.write('{"command": "check", "package": "a"}\n'
+            '{"command": "tree", "package": "oups"}\n'
+            '{"command": "buildorder", "package": "a"}\n')
+exitcode, output = run_std('A2_test_simple', '--batch local/batch.jsonl', ErrorCode.PACKAGE_NOT_FOUND)
+results = [json.loads(line) for line in output.splitlines()]
+test_eq([(result['command'], result['errorcode']) for result in results], [('check', 0), ('tree', 3), ('buildorder', 0)])
+test_eq(results[2]['result'][-1], 'a:0.1.2:anytrack:anyarch:unknown')
+os.remove('local/batch.jsonl')
+
+title('M1', 'many packages parsed with --jobs give the same answer and obsoleta.py is import safe')
+root = os.path.abspath('local/many')
+for index in range(250):
+    os.makedirs(f'{root}/p{index}', exist_ok=True)
+    with open(f'{root}/p{index}/obsoleta.json', 'w') as f:
+        depends = [{'name': f'p{index + 1}', 'version': '1.0.0'}] if index < 249 else []
+        json.dump({'name': f'p{index}', 'version': '1.0.0', 'depends': depends}, f)
+_, serial = run_from_absroot(root, '--package p240 --buildorder', ErrorCode.OK)
+_, parallel = run_from_absroot(root, '--package p240 --buildorder --jobs 4', ErrorCode.OK)
+test_eq(parallel, serial)
+# a spawned process pool worker runs the main module as __mp_main__
+_, output = execute('python3 -c "import runpy; runpy.run_path(\'obsoleta.py\', run_name=\'__mp_main__\')"')
+test_eq(output, '')
+# with other threads running, e.g. in --serve, the workers are started without forking
+with open('local/threaded_jobs.py', 'w') as f:
+    f.write(f'''import threading
+from obsoleta.common import Conf
+from obsoleta.obsoleta_api import Args
+from obsoleta.package import Package
+from obsoleta.loader import pool_context
+import obsoleta.obsoletacore as core
+
+
+def build_order(jobs, results):
+    conf = Conf('{TESTDATA_PATH}/test.conf')
+    conf.jobs = jobs
+    args = Args()
+    args.set_root('{root}')
+    obsoleta = core.Obsoleta(conf, args)
+    package = Package.construct_from_compact(conf, 'p240')
+    results.append((pool_context().get_start_method(), [str(p) for p in obsoleta.dump_build_order(package)[1]]))
+
+
+if __name__ == '__main__':
+    results = []
+    build_order(1, results)
+    thread = threading.Thread(target=build_order, args=(4, results))
+    thread.start()
+    thread.join()
+    print(results[0][0] == 'fork', results[1][0] != 'fork', results[0][1] == results[1][1])
+''')
+_, output = execute('PYTHONPATH=. python3 local/threaded_jobs.py')
+test_eq(output.splitlines()[-1], 'True True True')
+os.remove('local/threaded_jobs.py')
+shutil.rmtree(root)
+
 print('test suite took %.3f secs' % (time.time() - start_time))
 
 print("\npass\n")
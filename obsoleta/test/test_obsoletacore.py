@@ -2,11 +2,19 @@
 """
 Unittesting of obsoletacore.
 """
-import os, sys
+import os, sys, json, time, pickle, shutil, tempfile, concurrent.futures
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
 from obsoleta.test.test_common import TESTDATA_PATH, title, test_eq
-from obsoleta.common import Conf
-from obsoleta.obsoleta_api import Args
+from obsoleta.common import Conf, Error, find_in_path
+from obsoleta.scanner import Scanner
+from obsoleta.loader import PackageCache
+from obsoleta import cachefile
+from obsoleta.cachefile import clear_cache_dir
+from obsoleta.exceptions import ObsoletaException, ModelFrozen
+from obsoleta.errorcodes import ErrorCode
+from obsoleta.package import Package
+from obsoleta import log
+from obsoleta.obsoleta_api import Args, ObsoletaApi
 import obsoleta.obsoletacore as core
 
 args = Args()
@@ -22,6 +30,20 @@ obsoleta = core.Obsoleta.__new__(core.Obsoleta)
 obsoleta.args = args
 obsoleta.conf = conf
 
+temporary_dirs = []
+
+
+def make_temporary_dir():
+    directory = tempfile.mkdtemp(prefix='test_obsoletacore_')
+    temporary_dirs.append(directory)
+    return directory
+
+
+def remove_temporary_dirs():
+    while temporary_dirs:
+        shutil.rmtree(temporary_dirs.pop(), ignore_errors=True)
+
+
 # ----------------------------------------------------------------
 
 title('TOCORE 1', 'construct_root_list, remove duplicates')
@@ -62,3 +84,508 @@ PATH2 = '/here/we/go/sub1/sub2/keepme'
 obsoleta.conf.paths = [PATH1, PATH2]
 roots = obsoleta.construct_root_list()
 test_eq(roots, [PATH1, PATH2])
+
+PATH1 = '/here/we/go'
+PATH2 = '/here/we/go/sub1/deleteme'
+PATH3 = '/here/we/go/sub1/deleteme/sub2/deleteme'
+
+obsoleta.conf.paths = [PATH3, PATH1, PATH2, PATH1]
+roots = obsoleta.construct_root_list()
+test_eq(roots, [PATH1])
+test_eq(obsoleta.merged_roots, {PATH2: PATH1, PATH3: PATH2})
+
+
+title('TOCORE 2', 'construct_root_list, merged roots are scanned with the full depth')
+
+root = make_temporary_dir()
+nested = os.path.join(root, 'sub1')
+deep = os.path.join(nested, 'sub2', 'sub3')
+os.makedirs(deep, exist_ok=True)
+for path in (root, nested, deep):
+    with open(os.path.join(path, 'obsoleta.json'), 'w') as f:
+        f.write('{}')
+
+obsoleta.conf.paths = [root, nested]
+roots = obsoleta.construct_root_list()
+test_eq(roots, [root])
+expected = [os.path.join(path, 'obsoleta.json') for path in (root, nested, deep)]
+
+results = []
+find_in_path(root, 'obsoleta.json', obsoleta.conf, results, merged_roots=obsoleta.merged_roots)
+test_eq(sorted(results), expected)
+test_eq(sorted(Scanner(obsoleta.conf, jobs=2, merged_roots=obsoleta.merged_roots).scan(roots)), expected)
+
+results = []
+find_in_path(root, 'obsoleta.json', obsoleta.conf, results)
+test_eq(sorted(results), expected[:2])
+remove_temporary_dirs()
+
+
+title('TOCORE 3', 'loading in a process pool gives the same packages and errors as loading sequentially')
+
+
+def load(root, jobs):
+    load_conf = Conf(f'{TESTDATA_PATH}/test.conf')
+    load_conf.jobs = jobs
+    load_args = Args()
+    load_args.set_root(os.path.join(TESTDATA_PATH, root))
+    try:
+        loaded = core.Obsoleta(load_conf, load_args)
+    except ObsoletaException as e:
+        return e.ErrorCode, str(e)
+    return [(str(package), package.get_path(), package.get_root_error(), package.get_nof_dependencies())
+            for package in loaded.loaded_packages]
+
+
+core.Obsoleta.parallel_load_threshold = 0
+for root in ('A1_test_obsoleta', 'A3_test_simple_bad_json', 'F1_test_duplicate_package',
+             'F2_test_duplicate_package_slotted_ok', 'F5_test_slotted_missing_key_file', 'G1_test_multislot'):
+    test_eq(load(root, 3), load(root, 1))
+core.Obsoleta.parallel_load_threshold = 200
+
+
+title('TOCORE 4', 'the name index gives the loaded packages with the same name in loaded order')
+
+index_args = Args()
+index_args.set_root(os.path.join(TESTDATA_PATH, 'C5_test_multiple_versions'))
+indexed = core.Obsoleta(Conf(f'{TESTDATA_PATH}/test.conf'), index_args)
+for loaded_package in indexed.loaded_packages:
+    name = loaded_package.get_name()
+    test_eq(indexed.candidates(loaded_package),
+            [package for package in indexed.loaded_packages if package.get_name() == name])
+test_eq(indexed.candidates(Package.construct_from_compact(indexed.conf, '*')), indexed.loaded_packages)
+test_eq(indexed.candidates(Package.construct_from_compact(indexed.conf, 'nonexisting')), [])
+
+
+title('TOCORE 5', 'resolved dependencies are the loaded packages themselves, each resolved once')
+
+resolved = indexed
+test_eq(resolved.circular, set())
+loaded_ids = set(id(package) for package in resolved.loaded_packages)
+for loaded_package in resolved.loaded_packages:
+    for dependency in loaded_package.get_dependencies() or []:
+        test_eq(id(dependency) in loaded_ids, True)
+
+
+title('TOCORE 6', 'the depth of the dependency tree is not limited by the recursion limit')
+
+root = make_temporary_dir()
+chain_length = 300
+for index in range(chain_length):
+    os.makedirs(os.path.join(root, f'p{index}'), exist_ok=True)
+    dictionary = {'name': f'p{index}', 'version': '1.0.0'}
+    if index < chain_length - 1:
+        dictionary['depends'] = [{'name': f'p{index + 1}', 'version': '1.0.0'}]
+    with open(os.path.join(root, f'p{index}', 'obsoleta.json'), 'w') as f:
+        json.dump(dictionary, f)
+
+deep_conf = Conf(f'{TESTDATA_PATH}/test.conf')
+deep_conf.depth = 2
+deep_args = Args()
+deep_args.set_root(root)
+recursion_limit = sys.getrecursionlimit()
+sys.setrecursionlimit(150)
+try:
+    deep = core.Obsoleta(deep_conf, deep_args)
+    top = Package.construct_from_compact(deep_conf, 'p0')
+    error, tree = deep.dump_tree(top)
+    test_eq(error.is_ok(), True)
+    test_eq(len(tree), chain_length)
+    test_eq(tree[-1].strip(), f'p{chain_length - 1}:1.0.0:anytrack:anyarch:unknown')
+    test_eq(deep.get_errors(top)[0].is_ok(), True)
+    errors, build_order = deep.dump_build_order(top)
+    test_eq(len(build_order), chain_length)
+finally:
+    sys.setrecursionlimit(recursion_limit)
+remove_temporary_dirs()
+
+
+title('TOCORE 7', 'every package in a dependency cycle gets a circular dependency error with the cycle')
+
+
+def write_packages(root, packages, mtime=None):
+    """
+    Write a package file for each name -> [dependency names] in 'packages' in the directory 'name'
+    below 'root'. The files get the modification time 'mtime' if given.
+    """
+    for name, depends in packages.items():
+        os.makedirs(os.path.join(root, name), exist_ok=True)
+        dictionary = {'name': name, 'version': '1.0.0',
+                      'depends': [{'name': depend, 'version': '1.0.0'} for depend in depends]}
+        with open(os.path.join(root, name, 'obsoleta.json'), 'w') as f:
+            json.dump(dictionary, f)
+        if mtime is not None:
+            set_mtime(root, name, mtime)
+
+
+def set_mtime(root, name, mtime):
+    os.utime(os.path.join(root, name, 'obsoleta.json'), (mtime, mtime))
+
+
+def make_conf(**conf_overrides):
+    """
+    Return the test configuration with depth 2 and the settings in 'conf_overrides'. With the cache
+    enabled the cache files go to a temporary directory unless a cache_dir is given.
+    """
+    made_conf = Conf(f'{TESTDATA_PATH}/test.conf')
+    made_conf.depth = 2
+    if conf_overrides.get('cache') and 'cache_dir' not in conf_overrides:
+        conf_overrides['cache_dir'] = make_temporary_dir()
+    for key, value in conf_overrides.items():
+        setattr(made_conf, key, value)
+    return made_conf
+
+
+def make_obsoleta(packages, mtime=None, **conf_overrides):
+    """
+    Write the 'packages', see write_packages(), to a temporary directory and return the Obsoleta loaded
+    from it with make_conf(**conf_overrides). The directory is obsoleta.conf.root and obsoleta.args loads
+    it again. The temporary directories are deleted by remove_temporary_dirs().
+    """
+    root = make_temporary_dir()
+    write_packages(root, packages, mtime)
+    root_args = Args()
+    root_args.set_root(root)
+    return core.Obsoleta(make_conf(**conf_overrides), root_args)
+
+
+circular_args = Args()
+circular_args.set_root(os.path.join(TESTDATA_PATH, 'C7_test_circular_dependency'))
+circular = core.Obsoleta(Conf(f'{TESTDATA_PATH}/test.conf'), circular_args)
+messages = [[(error.get_errorcode(), error.get_message()) for error in package.get_errors()]
+            for package in circular.loaded_packages]
+test_eq(messages, [[(ErrorCode.CIRCULAR_DEPENDENCY, 'a -> b -> c -> a')],
+                   [(ErrorCode.CIRCULAR_DEPENDENCY, 'b -> c -> a -> b')],
+                   [(ErrorCode.CIRCULAR_DEPENDENCY, 'c -> a -> b -> c')]])
+
+circular = make_obsoleta({'x': ['a'], 'a': ['b'], 'b': ['a', 'c'], 'c': ['b', 'd'], 'd': []})
+messages = {package.get_name(): [error.get_message() for error in package.get_errors() or []]
+            for package in circular.loaded_packages}
+test_eq(messages, {'a': ['a -> b -> a, cycles between a, b, c'],
+                   'b': ['b -> a -> b, cycles between a, b, c'],
+                   'c': ['c -> b -> c, cycles between a, b, c'],
+                   'd': [], 'x': []})
+error, _ = circular.dump_tree(Package.construct_from_compact(circular.conf, 'x'))
+test_eq(error.get_errorcode(), ErrorCode.CIRCULAR_DEPENDENCY)
+error, _ = circular.dump_tree(Package.construct_from_compact(circular.conf, 'd'))
+test_eq(error.is_ok(), True)
+remove_temporary_dirs()
+
+
+title('TOCORE 8', 'attributes are aggregated once per package and arch collisions reported per downstream')
+
+collision_args = Args()
+collision_args.set_root(os.path.join(TESTDATA_PATH, 'C9_upstream_collisions'))
+collisions = core.Obsoleta(Conf(f'{TESTDATA_PATH}/test.conf'), collision_args)
+test_eq(set(collisions.aggregated), set(id(package) for package in collisions.loaded_packages))
+errors = {package.get_name(): [error.get_errorcode() for error in package.get_errors() or []]
+          for package in collisions.loaded_packages}
+test_eq(errors, {'a': [], 'b': [], 'c': [], 's': [], 'u': [], 'v': [],
+                 't': [ErrorCode.ARCH_MISMATCH, ErrorCode.ARCH_MISMATCH]})
+test_eq([str(error) for error in collisions.get_errors(Package.construct_from_compact(collisions.conf, 'a'))[1]],
+        ['Mixing different arch: t:1:anytrack:linux_x86_32:release'])
+
+
+title('TOCORE 9', 'multiple versions are found per package tree in the order they are found in the tree')
+
+multiple_versions = indexed.find_multiple_versions(indexed.loaded_packages)
+names = {package.get_name(): [[(candidate.to_string(), parent.get_name()) for candidate, parent in candidates]
+                              for candidates in multiple_versions.get(id(package), [])]
+         for package in indexed.loaded_packages}
+test_eq(names['a'], [[('c:1.2.3:production:anyarch:unknown', 'b'), ('c:1.2.4:production:anyarch:unknown', 'd')]])
+test_eq(names['b'], [[('c:1.2.3:production:anyarch:unknown', 'b'), ('c:1.2.4:production:anyarch:unknown', 'd')]])
+test_eq(names['d'], [])
+
+# the parent in the errors requires the package in that tree, whichever tree resolved it last
+for loaded_package in indexed.loaded_packages:
+    for error in loaded_package.get_errors() or []:
+        parent = next(package for package in indexed.loaded_packages
+                      if error.get_message().startswith(f'with parent {package.to_string()}:'))
+        test_eq(error.get_package() in parent.get_dependencies(), True)
+
+
+title('TOCORE 10', 'lazy resolving only resolves the packages reachable from the package queried')
+
+eager = make_obsoleta({'x': ['a', '*'], 'a': ['b'], 'b': ['c', 'missing'], 'c': [], 'y': ['z'], 'z': []})
+lazy_conf = make_conf(lazy=True)
+lazy = core.Obsoleta(lazy_conf, eager.args)
+test_eq(lazy.unresolved_names, {'a', 'b', 'c', 'x', 'y', 'z'})
+
+b = Package.construct_from_compact(lazy_conf, 'b')
+test_eq(lazy.dump_tree(b)[1], eager.dump_tree(b)[1])
+test_eq(lazy.unresolved_names, {'a', 'x', 'y', 'z'})
+test_eq(lazy.get_errors(b)[1], eager.get_errors(b)[1])
+
+a = Package.construct_from_compact(lazy_conf, 'a')
+test_eq(lazy.dump_build_order(a)[1], eager.dump_build_order(a)[1])
+test_eq(lazy.unresolved_names, {'x', 'y', 'z'})
+
+# a '*' dependency reaches everything
+x = Package.construct_from_compact(lazy_conf, 'x')
+test_eq(lazy.dump_tree(x)[1], eager.dump_tree(x)[1])
+test_eq(lazy.unresolved_names, set())
+remove_temporary_dirs()
+
+
+title('TOCORE 11', 'downstreams are found from the reverse dependency index with each downstream followed once')
+
+downstream = make_obsoleta({'x': ['a', 'b'], 'a': ['c'], 'b': ['c'], 'c': ['d'], 'd': [], 'y': ['b']})
+d = Package.construct_from_compact(downstream.conf, 'd')
+c = Package.construct_from_compact(downstream.conf, 'c')
+
+error, downstreams = downstream.locate_downstreams(d, core.UpDownstreamFilter.FollowTree)
+test_eq([package.get_name() for package in downstreams], ['a', 'b', 'c', 'x', 'y'])
+error, downstreams = downstream.locate_downstreams(c, core.UpDownstreamFilter.ExplicitReferences)
+test_eq([package.get_name() for package in downstreams], ['a', 'b'])
+test_eq(set(downstream.downstream_index), {'a', 'b', 'c', 'd'})
+error, downstreams = downstream.locate_downstreams(Package.construct_from_compact(downstream.conf, 'missing'),
+                                                   core.UpDownstreamFilter.FollowTree)
+test_eq(error.get_errorcode(), ErrorCode.PACKAGE_NOT_FOUND)
+remove_temporary_dirs()
+
+
+title('TOCORE 12', 'the errors in a package tree are summarized once per package and counted once per path')
+
+errors = make_obsoleta({'x': ['a', 'b'], 'a': ['c'], 'b': ['c', 'missing'], 'c': ['missing'], 'd': []})
+for package in errors.loaded_packages:
+    summary, count = errors.error_summary(package)
+    test_eq(count, len(package.error_list_append([])))
+    test_eq(sorted(set(summary)), sorted(set(package.error_list_append([]))))
+test_eq([len(errors.error_summary(package)[0]) for package in errors.loaded_packages], [1, 2, 1, 0, 2])
+test_eq(errors.get_error_count(), 7)
+error, x_errors = errors.get_errors(Package.construct_from_compact(errors.conf, 'x'))
+test_eq(error.get_errorcode(), ErrorCode.RESOLVE_ERROR)
+test_eq(len(x_errors), 1)
+remove_temporary_dirs()
+
+
+title('TOCORE 13', 'errors are equal by errorcode and package and are sorted by errorcode, message and package')
+
+a = Package.construct_from_compact(conf, 'a:1.0.0')
+b = Package.construct_from_compact(conf, 'b:1.0.0')
+test_eq(Error(ErrorCode.PACKAGE_NOT_FOUND, a, 'required by x'), Error(ErrorCode.PACKAGE_NOT_FOUND, a, 'required by y'))
+test_eq(len({Error(ErrorCode.PACKAGE_NOT_FOUND, a, 'required by x'), Error(ErrorCode.PACKAGE_NOT_FOUND, a),
+             Error(ErrorCode.PACKAGE_NOT_FOUND, b), Error(ErrorCode.ARCH_MISMATCH, a)}), 3)
+unsorted = [Error(ErrorCode.ARCH_MISMATCH, a, 'm1'), Error(ErrorCode.PACKAGE_NOT_FOUND, b, 'm2'),
+            Error(ErrorCode.PACKAGE_NOT_FOUND, a, 'm2'), Error(ErrorCode.PACKAGE_NOT_FOUND, b, 'm1')]
+test_eq([error.print() for error in sorted(unsorted)],
+        [error.print() for error in [unsorted[3], unsorted[2], unsorted[1], unsorted[0]]])
+
+
+title('TOCORE 14', 'a frozen model answers queries from several threads and changes are made to a new model')
+
+frozen = make_obsoleta({'x': ['a', 'b'], 'a': ['c'], 'b': ['c'], 'c': ['d'], 'd': [], 'y': ['b']},
+                       lazy=True).freeze()
+root = frozen.conf.root
+test_eq(frozen.unresolved_names, set())
+names = ['x', 'y', 'a', 'b', 'c', 'd'] * 20
+
+
+def query(name):
+    package = Package.construct_from_compact(frozen.conf, name)
+    return (frozen.dump_tree(package)[1], [str(p) for p in frozen.dump_build_order(package)[1]],
+            frozen.locate_downstreams(package, core.UpDownstreamFilter.FollowTree)[1], frozen.get_errors(package)[1])
+
+
+# the log indent is per thread, the tests above that raise halfway leave the main thread indented
+log.reset_indent()
+expected = [query(name) for name in names]
+with concurrent.futures.ThreadPoolExecutor(8) as executor:
+    test_eq(list(executor.map(query, names)), expected)
+
+frozen_api = ObsoletaApi(frozen.conf, frozen.args).freeze()
+for change in (lambda: frozen.reload(frozen.package_files), lambda: frozen.load(frozen.package_files),
+               frozen.resolve, lambda: frozen.add_loaded_package(frozen.loaded_packages[0]),
+               lambda: frozen_api.bump('d', '2.0.0', dryrun=True)):
+    try:
+        change()
+        test_eq(False)
+    except ModelFrozen:
+        pass
+
+write_packages(root, {'d': ['missing']})
+reloaded = frozen.reloaded(changed_files=[os.path.join(root, 'd', 'obsoleta.json')])
+test_eq(reloaded.frozen, True)
+x = Package.construct_from_compact(frozen.conf, 'x')
+test_eq(frozen.get_errors(x)[1], [])
+test_eq([error.get_errorcode() for error in reloaded.get_errors(x)[1]], [ErrorCode.PACKAGE_NOT_FOUND])
+test_eq([query(name) for name in names], expected)
+remove_temporary_dirs()
+
+
+title('TOCORE 15', 'the cache reuses unchanged package files and the packages are always resolved')
+
+# files modified within PackageCache.racy_seconds are not cached
+old = time.time() - 10
+cached = make_obsoleta({'x': ['a', 'b'], 'a': ['c'], 'b': ['c'], 'c': [], 'y': []}, old, cache=True)
+root = cached.conf.root
+x = Package.construct_from_compact(cached.conf, 'x')
+tree = cached.dump_tree(x)[1]
+cache_file = cached.cache_filename('obsoleta.cache')
+cache = PackageCache(cache_file)
+test_eq(len(cache.files), 5)
+test_eq(core.Obsoleta(cached.conf, cached.args).dump_tree(x)[1], tree)
+
+# a touched file with the same content is not parsed again, a changed file is and a deleted file is dropped
+set_mtime(root, 'a', old + 1)
+write_packages(root, {'c': ['missing']}, old)
+shutil.rmtree(os.path.join(root, 'y'))
+cached = core.Obsoleta(cached.conf, cached.args)
+test_eq([error.get_errorcode() for error in cached.get_errors(x)[1]], [ErrorCode.PACKAGE_NOT_FOUND])
+test_eq(len(cached.loaded_packages), 4)
+cache = PackageCache(cache_file)
+test_eq(sorted(os.path.basename(os.path.dirname(file)) for file in cache.files), ['a', 'b', 'c', 'x'])
+for file in cache.files:
+    cache.read(file)
+test_eq((cache.reused, cache.parsed), (4, 0))
+remove_temporary_dirs()
+
+
+title('TOCORE 16', 'the resolved packages are taken from the graph cache while the package files are unchanged')
+
+old = time.time() - 10
+fresh = make_obsoleta({'x': ['a', 'b', 'missing'], 'a': ['c'], 'b': ['c'], 'c': [], 'y': ['z'], 'z': ['y']},
+                      old, cache=True)
+root = fresh.conf.root
+graph = core.Obsoleta(fresh.conf, fresh.args)
+test_eq((len(fresh.package_dictionaries), len(graph.package_dictionaries)), (6, 0))
+
+
+def differences(cached, resolved):
+    """
+    Return the (package, attribute) of every attribute that differs between the packages reachable
+    from the 'cached' and the 'resolved' packages. Referenced packages must be referenced the same
+    way in both models.
+    """
+    matching = {id(c): r for c, r in zip(cached, resolved)}
+    pairs = list(zip(cached, resolved))
+    differing = []
+    for c, r in pairs:
+        for attribute in sorted(set(vars(c)) | set(vars(r))):
+            if attribute in ('parent', 'dependencies', 'errors'):
+                continue
+            if getattr(c, attribute, differences) != getattr(r, attribute, differences):
+                differing.append((r.to_string(), attribute))
+        if (c.errors is None) != (r.errors is None) or \
+                [(e.errorcode, e.message, e.key) for e in c.errors or ()] != \
+                [(e.errorcode, e.message, e.key) for e in r.errors or ()]:
+            differing.append((r.to_string(), 'errors'))
+        if len(c.dependencies) != len(r.dependencies):
+            differing.append((r.to_string(), 'dependencies'))
+            continue
+        references = zip([c.parent] + c.dependencies + [e.package for e in c.errors or ()],
+                         [r.parent] + r.dependencies + [e.package for e in r.errors or ()])
+        for c_reference, r_reference in references:
+            if c_reference is None or r_reference is None:
+                if c_reference is not r_reference:
+                    differing.append((r.to_string(), 'reference'))
+            elif id(c_reference) not in matching:
+                matching[id(c_reference)] = r_reference
+                pairs.append((c_reference, r_reference))
+            elif matching[id(c_reference)] is not r_reference:
+                differing.append((r.to_string(), 'reference'))
+    return differing
+
+
+test_eq(differences(graph.loaded_packages, fresh.loaded_packages), [])
+
+
+def answers(obsoleta):
+    packages = [Package.construct_from_compact(obsoleta.conf, name) for name in ('x', 'a', 'y')]
+    return ([obsoleta.dump_tree(package)[1] for package in packages],
+            [[str(p) for p in obsoleta.dump_build_order(package)[1]] for package in packages],
+            [[error.print() for error in obsoleta.get_errors(package)[1]] for package in packages],
+            [obsoleta.locate_upstreams(package, core.UpDownstreamFilter.FollowTree)[0].get_errorcode()
+             for package in packages],
+            [str(p) for p in obsoleta.locate_downstreams(packages[1], core.UpDownstreamFilter.FollowTree)[1]],
+            [package.get_name() for package in obsoleta.loaded_packages if id(package) in obsoleta.circular])
+
+
+test_eq(answers(graph), answers(fresh))
+loaded = {package.get_name(): package for package in graph.loaded_packages}
+test_eq(loaded['a'].get_dependencies()[0] is loaded['c'] and loaded['b'].get_dependencies()[0] is loaded['c'], True)
+
+# a changed package file or configuration makes the graph out of date
+write_packages(root, {'c': ['missing']}, old)
+test_eq(len(core.Obsoleta(fresh.conf, fresh.args).package_dictionaries), 6)
+duplicates_conf = make_conf(cache=True, cache_dir=fresh.conf.cache_dir, allow_duplicates=True)
+test_eq(len(core.Obsoleta(duplicates_conf, fresh.args).package_dictionaries), 6)
+
+
+# the graph is plain data, anything else in the file is never run
+class Planted:
+    def __reduce__(self):
+        return os.mkdir, (os.path.join(root, 'planted'),)
+
+
+with open(fresh.cache_filename('obsoleta.graph'), 'wb') as f:
+    f.write(b'obsoleta graph\n' + pickle.dumps(Planted()))
+parsed = core.Obsoleta(fresh.conf, fresh.args)
+test_eq((len(parsed.package_dictionaries), os.path.exists(os.path.join(root, 'planted'))), (6, False))
+test_eq(answers(core.Obsoleta(fresh.conf, fresh.args)), answers(parsed))
+remove_temporary_dirs()
+
+
+title('TOCORE 17', 'each roots and configuration has its own cache files which parallel runs can share')
+
+first = make_obsoleta({'x': ['a'], 'a': [], 'y': []}, time.time() - 10, cache=True)
+root = first.conf.root
+cache_dir = first.conf.cache_dir
+test_eq(core.Obsoleta(make_conf(cache=True, cache_dir=cache_dir), first.args).cache_dir, first.cache_dir)
+test_eq(core.Obsoleta(make_conf(cache=True, cache_dir=cache_dir, jobs=4), first.args).cache_dir, first.cache_dir)
+deeper = core.Obsoleta(make_conf(cache=True, cache_dir=cache_dir, depth=3), first.args)
+test_eq(deeper.cache_dir != first.cache_dir, True)
+other_args = Args()
+other_args.set_root(os.path.join(root, 'y'))
+other = core.Obsoleta(first.conf, other_args)
+test_eq(other.cache_dir != first.cache_dir, True)
+test_eq(len(core.Obsoleta(first.conf, first.args).package_dictionaries), 0)
+
+parallel_conf = make_conf(cache=True, cache_dir=cache_dir, jobs=4)
+x = Package.construct_from_compact(parallel_conf, 'x')
+
+
+def run_cached(_):
+    return core.Obsoleta(parallel_conf, first.args).dump_tree(x)[1]
+
+
+# parallel runs replacing the cache files never leave a partial or temporary file behind
+shutil.rmtree(first.cache_dir)
+with concurrent.futures.ThreadPoolExecutor(8) as executor:
+    trees = list(executor.map(run_cached, range(16)))
+test_eq(trees, [['x:1.0.0:anytrack:anyarch:unknown', '  a:1.0.0:anytrack:anyarch:unknown']] * 16)
+test_eq(sorted(os.listdir(first.cache_dir)), ['obsoleta.cache', 'obsoleta.graph'])
+test_eq([os.stat(first.cache_filename(name)).st_mode & 0o777 for name in ('obsoleta.cache', 'obsoleta.graph')],
+        [cachefile.file_mode] * 2)
+test_eq(len(PackageCache(first.cache_filename('obsoleta.cache')).files), 3)
+test_eq(len(core.Obsoleta(first.conf, first.args).package_dictionaries), 0)
+
+# another obsoleta doesn't use the cache files
+source_digest = cachefile.source_digest()
+cachefile._source_digest = 'another obsoleta'
+another = core.Obsoleta(first.conf, first.args)
+cachefile._source_digest = source_digest
+test_eq((another.cache_dir != first.cache_dir, len(another.package_dictionaries)), (True, 3))
+test_eq(clear_cache_dir(cache_dir), sorted([first.cache_dir, deeper.cache_dir, other.cache_dir, another.cache_dir]))
+test_eq(clear_cache_dir(cache_dir), [])
+remove_temporary_dirs()
+
+
+title('TOCORE 18', 'dependencies only differing by their "so" directory are looked up separately')
+
+root = make_temporary_dir()
+so_path = os.path.join(root, 'lib')
+os.makedirs(so_path)
+os.symlink('libext.so.1.0.0', os.path.join(so_path, 'libext.so'))
+for name, so in (('x', os.path.join(root, 'nolib')), ('y', so_path)):
+    os.makedirs(os.path.join(root, name))
+    with open(os.path.join(root, name, 'obsoleta.json'), 'w') as f:
+        json.dump({'name': name, 'version': '1.0.0', 'depends': [{'name': 'ext', 'version': '1.0.0', 'so': so}]}, f)
+so_args = Args()
+so_args.set_root(root)
+external = core.Obsoleta(make_conf(), so_args)
+test_eq([error.get_errorcode() for error in external.get_errors(Package.construct_from_compact(external.conf, 'y'))[1]],
+        [])
+test_eq(external.dump_tree(Package.construct_from_compact(external.conf, 'y'))[1],
+        ['y:1.0.0:anytrack:anyarch:unknown', '  ext:1.0.0:anytrack:anyarch:unknown'])
+remove_temporary_dirs()
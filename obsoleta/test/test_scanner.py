@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Unittesting of the package file scanner.
+"""
+import os, sys, json, shutil, tempfile, subprocess
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from obsoleta.test.test_common import TESTDATA_PATH, title, test_eq, populate_local_temp
+from obsoleta.common import Conf, find_in_path
+from obsoleta.scanner import Scanner, Manifest, ParsePipeline
+from obsoleta.pathfilter import PathFilter
+from obsoleta.gitindex import find_in_git_index
+
+conf = Conf(f'{TESTDATA_PATH}/test.conf')
+
+
+def serial_scan(roots):
+    results = []
+    for root in roots:
+        find_in_path(root, 'obsoleta.json', conf, results)
+    return results
+
+# ----------------------------------------------------------------
+
+
+title('TSCAN 1', 'parallel scan gives the same files in the same order as the serial scan')
+
+roots = [TESTDATA_PATH, os.path.join(TESTDATA_PATH, 'A2_test_simple')]
+
+for depth in (0, 1, 2, 4):
+    conf.depth = depth
+    expected = serial_scan(roots)
+    for jobs in (1, 2, 8):
+        test_eq(Scanner(conf, jobs=jobs).scan(roots), expected)
+
+
+title('TSCAN 2', 'parallel scan honors obsoleta.skip and blacklist_paths')
+
+conf.depth = 4
+root = os.path.join(TESTDATA_PATH, 'F4_test_duplicate_package_with_skip_file')
+result = Scanner(conf, jobs=4).scan([root])
+test_eq(result, serial_scan([root]))
+test_eq([path for path in result if 'a_skip_file' in path], [])
+
+root = os.path.join(TESTDATA_PATH, 'F7_test_duplicate_package_blacklist_paths')
+result = Scanner(conf, jobs=4).scan([root])
+test_eq(result, serial_scan([root]))
+test_eq(len(result), 1)
+
+
+title('TSCAN 3', 'a scan manifest reuses unchanged directories and relists modified ones')
+
+root = os.path.abspath(populate_local_temp('A2_test_simple'))
+with tempfile.TemporaryDirectory() as directory:
+    manifest_file = os.path.join(directory, 'test_scanner.manifest')
+    expected = serial_scan([root])
+
+    manifest = Manifest(manifest_file)
+    manifest.racy_seconds = 0
+    test_eq(Scanner(conf, manifest=manifest).scan([root]), expected)
+    test_eq(manifest.reused, 0)
+    manifest.save()
+
+    manifest = Manifest(manifest_file)
+    test_eq(Scanner(conf, manifest=manifest).scan([root]), expected)
+    test_eq(manifest.rescanned, 0)
+    test_eq(manifest.reused, len(expected) + 1)
+    manifest.save()
+
+    shutil.rmtree(os.path.join(root, 'e'))
+    os.utime(root, ns=(0, 0))
+    manifest = Manifest(manifest_file)
+    test_eq(Scanner(conf, manifest=manifest).scan([root]), serial_scan([root]))
+    test_eq(manifest.rescanned, 1)
+    test_eq(len(serial_scan([root])), len(expected) - 1)
+
+
+title('TSCAN 4', 'the compiled blacklist matches like the plain substring test and counts prunes')
+
+substrings = ['build', 'uild_x', 'a2', 'x/y', 'y']
+path_filter = PathFilter(substrings)
+for path in ('/a/build', '/a/buil', '/a/uild_x', '/a1/a3', 'F7/a2/b', '/x/z', '/q/Y', '/x/y'):
+    expected = [substring for substring in substrings if substring in path]
+    rule = path_filter.match(path)
+    test_eq(rule in expected if expected else rule is None)
+
+test_eq(PathFilter(['']).match('/anything'), '')
+test_eq(PathFilter().match('/anything'), None)
+
+path_filter = PathFilter(['tmp'], ['*/build_*', '*.old'])
+test_eq(path_filter.prune('/src/build_arm'), '*/build_*')
+test_eq(path_filter.prune('/src/build_arm/sub'), '*/build_*')
+test_eq(path_filter.prune('/src/module.old'), '*.old')
+test_eq(path_filter.prune('/src/tmpfiles'), 'tmp')
+test_eq(path_filter.prune('/src/builds'), None)
+test_eq(path_filter.pruned_summary(), [('tmp', 1), ('*/build_*', 2), ('*.old', 1)])
+
+root = os.path.join(TESTDATA_PATH, 'F7_test_duplicate_package_blacklist_paths')
+conf.blacklist_globs = ['*/a2']
+path_filter = PathFilter(conf.blacklist_paths, conf.blacklist_globs)
+test_eq(len(Scanner(conf, path_filter=path_filter).scan([root])), 1)
+test_eq(sum(path_filter.pruned.values()), 1)
+conf.blacklist_globs = []
+
+
+title('TSCAN 5', 'the parse pipeline parses the files as they are found and skips invalid files')
+
+for jobs in (1, 4):
+    pipeline = ParsePipeline(jobs, queue_size=2)
+    results = []
+    find_in_path(TESTDATA_PATH, 'obsoleta.json', conf, results, found=pipeline.put)
+    dictionaries = pipeline.close()
+    test_eq(len(results) > 100)
+    for file in results:
+        try:
+            with open(file) as f:
+                expected = json.loads(f.read())
+        except ValueError:
+            test_eq(file not in dictionaries)
+            continue
+        test_eq(dictionaries[file], expected)
+
+    pipeline = ParsePipeline(jobs)
+    test_eq(Scanner(conf, jobs=4, found=pipeline.put).scan([TESTDATA_PATH]), results)
+    test_eq(pipeline.close(), dictionaries)
+
+
+title('TSCAN 6', 'the git index discovery finds the same files as the filesystem walk')
+
+root = os.path.abspath('local/test_git_index')
+shutil.rmtree(root, True)
+shutil.copytree(TESTDATA_PATH, root)
+subprocess.run(['git', 'init', '-q', root], check=True)
+subprocess.run(['git', '-C', root, 'add', '.'], check=True)
+
+
+def git_index_scan(path):
+    results = []
+    find_in_git_index(path, 'obsoleta.json', conf, results)
+    return sorted(results)
+
+
+for depth in (0, 1, 2, 4):
+    conf.depth = depth
+    test_eq(git_index_scan(root), sorted(serial_scan([root])))
+conf.depth = 4
+
+# untracked and ignored files and nested repositories that are not submodules are found as by the
+# filesystem walk, files deleted from the work tree are not
+os.makedirs(os.path.join(root, 'untracked/ignored'))
+os.makedirs(os.path.join(root, 'A2_test_simple/nested/package'))
+os.makedirs(os.path.join(root, 'A2_test_simple/generated'))
+for directory in ('untracked', 'untracked/ignored', 'A2_test_simple/nested/package', 'A2_test_simple/generated'):
+    with open(os.path.join(root, directory, 'obsoleta.json'), 'w') as f:
+        f.write('{}')
+subprocess.run(['git', 'init', '-q', os.path.join(root, 'A2_test_simple/nested')], check=True)
+with open(os.path.join(root, '.gitignore'), 'w') as f:
+    f.write('ignored\ngenerated/obsoleta.json\n')
+os.remove(os.path.join(root, 'A2_test_simple/a/obsoleta.json'))
+result = git_index_scan(root)
+for file in ('untracked/obsoleta.json', 'untracked/ignored/obsoleta.json', 'A2_test_simple/generated/obsoleta.json',
+             'A2_test_simple/nested/package/obsoleta.json'):
+    test_eq(os.path.join(root, file) in result)
+test_eq(os.path.join(root, 'A2_test_simple/a/obsoleta.json') not in result)
+test_eq(result, sorted(serial_scan([root])))
+for depth in (1, 2):
+    conf.depth = depth
+    test_eq(git_index_scan(root), sorted(serial_scan([root])))
+    test_eq(git_index_scan(os.path.join(root, 'untracked')), sorted(serial_scan([os.path.join(root, 'untracked')])))
+conf.depth = 4
+shutil.rmtree(root)
+
+# a root outside of a git work tree falls back to the filesystem walk
+with tempfile.TemporaryDirectory() as directory:
+    root = os.path.join(directory, 'A2_test_simple')
+    shutil.copytree(os.path.join(TESTDATA_PATH, 'A2_test_simple'), root)
+    test_eq(git_index_scan(root), sorted(serial_scan([root])))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Black-box test of obsoleta.py --serve and --connect. The answers from the server should be
+identical to the ones from plain obsoleta.py invocations, also after package files are changed.
+"""
+import os, sys, time, runpy, shutil, signal, logging, subprocess
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from obsoleta.errorcodes import ErrorCode
+from obsoleta.exceptions import ServerError
+from obsoleta.log import logger
+from obsoleta.test.test_common import TESTDATA_PATH, title, test_eq, execute, populate_local_temp
+
+root = os.path.abspath(populate_local_temp('A2_test_simple'))
+socket_path = os.path.abspath('local/test_server.sock')
+direct = f'./obsoleta.py --conf {TESTDATA_PATH}/test.conf --root {root}'
+client = f'./obsoleta.py --connect {socket_path}'
+
+server = subprocess.Popen(f'{direct} --serve {socket_path}'.split(),
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+for _ in range(100):
+    if os.path.exists(socket_path):
+        break
+    time.sleep(0.1)
+
+
+def compare(args, errorcode=ErrorCode.OK):
+    _, expected = execute(f'{direct} {args}', errorcode, quiet=True)
+    _, output = execute(f'{client} {args}', errorcode)
+    test_eq(output, expected)
+
+
+def wait_for_reload(args, text):
+    for _ in range(100):
+        output = subprocess.run(f'{client} {args}'.split(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout
+        if text in output.decode():
+            return
+        time.sleep(0.1)
+    test_eq(False)
+
+# ----------------------------------------------------------------
+
+
+try:
+    title('TSERVER 1', 'served answers are the same as the direct answers')
+    compare('--package a --tree')
+    compare('--package a --check')
+    compare('--package a --buildorder --printpaths')
+    compare('--package e --downstream')
+    compare('--package b --upstream')
+    compare('--package oups --tree', ErrorCode.PACKAGE_NOT_FOUND)
+
+    title('TSERVER 2', 'a modified package file is picked up by the server')
+    with open(os.path.join(root, 'e/obsoleta.json')) as f:
+        package_file = f.read()
+    with open(os.path.join(root, 'e/obsoleta.json'), 'w') as f:
+        f.write(package_file.replace('1.2.3', '1.2.4'))
+    wait_for_reload('--package a --tree', 'e:1.2.4')
+    compare('--package a --tree')
+
+    title('TSERVER 3', 'a removed package is picked up by the server')
+    os.remove(os.path.join(root, 'd/obsoleta.json'))
+    wait_for_reload('--package a --check', 'Package not found')
+    compare('--package a --check', ErrorCode.PACKAGE_NOT_FOUND)
+
+    title('TSERVER 3b', 'a package in a new directory is picked up by the server')
+    os.makedirs(os.path.join(root, 'new/f'))
+    with open(os.path.join(root, 'new/f/obsoleta.json'), 'w') as f:
+        f.write(package_file.replace('"e"', '"f"'))
+    wait_for_reload('--package f --tree', 'f:1.2.3')
+    compare('--package f --tree')
+    shutil.rmtree(os.path.join(root, 'new'))
+
+    title('TSERVER 4', 'a second server refuses a socket with a live server and --batch is not forwarded')
+    execute(f'{direct} --serve {socket_path}', ErrorCode.SERVER_ERROR)
+    compare('--package a --check', ErrorCode.PACKAGE_NOT_FOUND)
+    execute(f'{client} --batch -', ErrorCode.MISSING_INPUT)
+
+finally:
+    server.send_signal(signal.SIGINT)
+    server.wait()
+
+title('TSERVER 5', 'a client without a server fails with an error code')
+execute(f'{client} --package a --tree', ErrorCode.SERVER_ERROR)
+
+title('TSERVER 6', 'a query logs at the level the same command would have logged at directly')
+execute_query = runpy.run_path('obsoleta.py', run_name='obsoleta_main')['execute_query']
+levels = []
+for argv in (['--package', 'a', '--check'], ['--package', 'a', '--check', '--info']):
+    # the server sets its own level again after each query
+    logger.setLevel(logging.DEBUG)
+    test_eq(execute_query(None, argv, ServerError('not loaded')), ErrorCode.SERVER_ERROR)
+    levels.append(logger.level)
+test_eq(levels, [logging.WARNING, logging.INFO])
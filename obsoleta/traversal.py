@@ -0,0 +1,67 @@
+ENTER = 'enter'
+LEAVE = 'leave'
+
+
+class Walk:
+    """
+    An iterative depth first walk of the graph below 'root' using an explicit stack rather than
+    recursion, so the depth of the graph is not limited by the python recursion limit.
+
+    Iterating a Walk gives (ENTER, node) before and (LEAVE, node) after the children of a node
+    in exactly the order a recursive walk would visit them. 'children' is called with a node
+    right after its ENTER step and returns an iterable (or None). The iterable is consumed lazily,
+    one child at a time, so a generator can do work between the children the same way code after
+    a recursive call would.
+
+    With 'unique' a node already entered once (by identity) is skipped, otherwise a node is
+    entered once for every path to it.
+
+    The memory used is the stack of iterators for the current path. 'depth' is the depth of the
+    current node, the root has depth 0, and 'parent' is the node it was reached from.
+    """
+    def __init__(self, root, children, unique=False):
+        self.root = root
+        self.children = children
+        self.unique = unique
+        self.stack = []
+
+    @property
+    def depth(self):
+        return len(self.stack) - 1
+
+    @property
+    def parent(self):
+        if len(self.stack) > 1:
+            return self.stack[-2][0]
+        return None
+
+    def __iter__(self):
+        seen = {id(self.root)}
+        self.stack = [[self.root, None]]
+        yield ENTER, self.root
+        self.stack[-1][1] = iter(self.children(self.root) or ())
+
+        while self.stack:
+            frame = self.stack[-1]
+            for child in frame[1]:
+                if self.unique:
+                    if id(child) in seen:
+                        continue
+                    seen.add(id(child))
+                self.stack.append([child, None])
+                yield ENTER, child
+                self.stack[-1][1] = iter(self.children(child) or ())
+                break
+            else:
+                yield LEAVE, frame[0]
+                self.stack.pop()
+
+
+def preorder(root, children, unique=False):
+    """
+    Yield (node, depth) for the nodes below and including 'root' in depth first preorder.
+    """
+    walk = Walk(root, children, unique)
+    for step, node in walk:
+        if step == ENTER:
+            yield node, walk.depth